@@ -1,138 +1,1401 @@
-import mysql.connector
+import argparse
+import atexit
+import base64
+import contextvars
+import csv
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import queue
 import re
-from _decimal import Decimal
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from _decimal import Decimal, ROUND_HALF_UP
 from tabulate import tabulate
 import datetime
 
-# Connect to MySQL Database
-databaseobj = mysql.connector.connect(
-    host='localhost',
-    user='root',
-    password='faith',
-    database='librarydb'
-)
-cursor = databaseobj.cursor()
-
-# Create tables in the database
-
-# create author table
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Author (
-        AuthorID INT AUTO_INCREMENT PRIMARY KEY,
-        Name VARCHAR(100)
-    )
-""")
-
-# create genre table
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Genre (
-        GenreID INT AUTO_INCREMENT PRIMARY KEY,
-        Name VARCHAR(50)
-    )
-""")
-
-# create book table
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Book (
-        BookID INT AUTO_INCREMENT PRIMARY KEY,
-        Title VARCHAR(256),
-        AuthorID INT,
-        GenreID INT,
-        RentPrice DECIMAL(10,2),
-        FOREIGN KEY (AuthorID) REFERENCES Author(AuthorID),
-        FOREIGN KEY (GenreID) REFERENCES Genre(GenreID)
-    )
-""")
-
-# create login table
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Login (
-        Username VARCHAR(50) PRIMARY KEY,
-        Password VARCHAR(50),
-        FirstName VARCHAR(50),
-        LastName VARCHAR(50),
-        Email VARCHAR(50),
-        Role ENUM('admin', 'customer') NOT NULL
-    )
-""")
-
-# create plan table
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Plan (
-        PlanID INT AUTO_INCREMENT PRIMARY KEY,
-        Duration VARCHAR(255),
-        Cost DECIMAL(10,2),
-        Details VARCHAR(500)
-    )
-""")
-
-# create payment table
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Payment (
-        PaymentID INT AUTO_INCREMENT PRIMARY KEY,
-        UserID VARCHAR(50),
-        Amount DECIMAL(10,2),
-        PaymentDate DATE,
-        PaymentMethod VARCHAR(255),
-        FOREIGN KEY (UserID) REFERENCES Login(Username)
-    )
-""")
-
-# create checkout table
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Checkout (
-        CheckoutID INT AUTO_INCREMENT PRIMARY KEY,
-        UserID VARCHAR(50),
-        BookID INT,
-        PlanID INT,
-        Rating VARCHAR(255),
-        ReviewDate DATE,
-        FOREIGN KEY (UserID) REFERENCES Login(Username),
-        FOREIGN KEY (BookID) REFERENCES Book(BookID),
-        FOREIGN KEY (PlanID) REFERENCES Plan(PlanID)
-    )
-""")
+# mysql.connector is only needed by the MySQL backend, the SQLite backend runs without it
+try:
+    import mysql.connector
+    from mysql.connector import pooling
+    from mysql.connector.constants import ClientFlag
+except ImportError:
+    mysql = None
+
+# numpy and scipy build the recommendations with sparse matrix products, a pure Python version is used without them
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = None
+
+# pyarrow writes the Parquet and Arrow exports, CSV exports work without it
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Storage engine: "mysql" for a MySQL server, or "sqlite" for an embedded database file on a single machine
+DB_BACKEND = os.environ.get("LIBRARY_DB_BACKEND", "mysql")
+
+# MySQL connection settings, each one can be overridden through the environment
+DB_CONFIG = {
+    "host": os.environ.get("LIBRARY_DB_HOST", "localhost"),
+    "user": os.environ.get("LIBRARY_DB_USER", "root"),
+    "password": os.environ.get("LIBRARY_DB_PASSWORD", "faith"),
+    "database": os.environ.get("LIBRARY_DB_NAME", "librarydb"),
+}
+
+# Connection pool settings
+POOL_NAME = "librarypool"
+POOL_SIZE = int(os.environ.get("LIBRARY_DB_POOL_SIZE", "5"))
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get("LIBRARY_DB_POOL_TIMEOUT", "10"))
+RECONNECT_ATTEMPTS = 3
+RECONNECT_DELAY = 1
+
+# SQLite settings: the database file, how long a writer waits for the write lock, and how many compiled
+# statements each connection keeps for reuse
+SQLITE_PATH = os.environ.get("LIBRARY_SQLITE_PATH", "library.db")
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("LIBRARY_SQLITE_BUSY_TIMEOUT", "30"))
+SQLITE_STATEMENT_CACHE = int(os.environ.get("LIBRARY_SQLITE_STATEMENT_CACHE", "256"))
+
+
+# Class giving access to a MySQL server through a connection pool, the queries of the module are written in
+# MySQL's dialect so they are used as they are
+class MySQLBackend:
+    name = "mysql"
+
+    def __init__(self):
+        # The pool is created on first use and shared by every function in the module
+        self.pool = None
+
+    def get_pool(self):
+        if mysql is None:
+            raise RuntimeError("The MySQL backend needs the mysql-connector-python package.")
+        if self.pool is None:
+            self.pool = pooling.MySQLConnectionPool(
+                pool_name=POOL_NAME,
+                pool_size=POOL_SIZE,
+                pool_reset_session=True,
+                # Lets a connection go back to the pool even if a streaming read was stopped early
+                consume_results=True,
+                # Report matched rather than changed rows, so an UPDATE that keeps the same values still counts
+                client_flags=[ClientFlag.FOUND_ROWS],
+                **DB_CONFIG
+            )
+        return self.pool
+
+    # Check a connection out of the pool, waiting for a free one if the pool is exhausted
+    # The connection is pinged before use so a dropped connection is re-established instead of failing the caller
+    @contextmanager
+    def connection(self):
+        deadline = time.monotonic() + POOL_CHECKOUT_TIMEOUT
+        while True:
+            try:
+                connection = self.get_pool().get_connection()
+                break
+            except mysql.connector.errors.PoolError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+
+        try:
+            connection.ping(reconnect=True, attempts=RECONNECT_ATTEMPTS, delay=RECONNECT_DELAY)
+            yield connection
+        finally:
+            # Closing a pooled connection hands it back to the pool
+            connection.close()
+
+    # Forget the pool, a forked process must not reuse its parent's connections
+    def reset(self):
+        self.pool = None
+
+    def begin(self, connection):
+        # MySQL starts a transaction implicitly with the first statement
+        pass
+
+    def translate(self, query):
+        return query
+
+    # Error raised when a write breaks a unique or foreign key constraint
+    @property
+    def integrity_error(self):
+        return mysql.connector.errors.IntegrityError
+
+    def schema_statements(self, statement):
+        return [statement]
+
+    def has_index(self, cursor, table, index):
+        cursor.execute("SELECT 1 FROM information_schema.STATISTICS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s LIMIT 1",
+                       (table, index))
+        return cursor.fetchone() is not None
+
+    def has_column(self, cursor, table, column):
+        cursor.execute("SELECT 1 FROM information_schema.COLUMNS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+                       (table, column))
+        return cursor.fetchone() is not None
+
+    # Return the plan of a query as (table, access type, index used, rows examined, full scan) rows
+    def explain(self, cursor, query, params):
+        cursor.execute("EXPLAIN " + query, params)
+        columns = cursor.column_names
+        plans = []
+        for row in cursor.fetchall():
+            plan = dict(zip(columns, row))
+            # Access type ALL means MySQL reads every row of the table
+            plans.append((plan["table"], plan["type"], plan["key"], plan["rows"], plan["type"] == "ALL"))
+        return plans
+
+
+# Rewrites turning the module's MySQL statements into SQLite ones, each is (pattern, replacement)
+SQLITE_QUERY_REWRITES = [
+    (re.compile(r"%\((\w+)\)s"), r":\1"),
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"%%"), "%"),
+    (re.compile(r"\bINSERT IGNORE INTO\b"), "INSERT OR IGNORE INTO"),
+    (re.compile(r"\bON DUPLICATE KEY UPDATE\b"), "ON CONFLICT DO UPDATE SET"),
+    (re.compile(r"\bVALUES\((\w+)\)"), r"excluded.\1"),
+    # SQLite has no row locks, a write transaction holds the database write lock instead
+    (re.compile(r"\s+FOR UPDATE\b"), ""),
+    # Unnamed sums are added up by DECIMAL_SUM, the column name has the SUM converter read the total back as a
+    # Decimal like MySQL returns it, and the collation keeps ORDER BY on the total numeric
+    (re.compile(r"\bSUM\(([\w.]+)\)(?!\s+AS\b)"), r'DECIMAL_SUM(\1) COLLATE DECIMAL AS "SUM(\1) [SUM]"'),
+]
+
+SQLITE_SCHEMA_REWRITES = [
+    (re.compile(r"\bINT AUTO_INCREMENT PRIMARY KEY\b"), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"(\w+) ENUM\(([^)]*)\)"), r"\1 TEXT CHECK (\1 IN (\2))"),
+    # Text comparisons ignore case, like the default MySQL collation the queries were written for
+    (re.compile(r"\bVARCHAR\((\d+)\)"), r"VARCHAR(\1) COLLATE NOCASE"),
+    # Money columns would get NUMERIC affinity and be stored as binary floating point, they are kept as decimal
+    # text instead, compared as numbers by the DECIMAL collation
+    (re.compile(r"\bDECIMAL\(\d+,\s*2\)"), "MONEY TEXT COLLATE DECIMAL"),
+]
+
+
+# MySQL functions used by the queries that SQLite does not have, registered on every SQLite connection
+def sqlite_datediff(end, start):
+    if end is None or start is None:
+        return None
+    return (datetime.date.fromisoformat(str(end)[:10]) - datetime.date.fromisoformat(str(start)[:10])).days
+
+
+def sqlite_date_part(part):
+    def extract(value):
+        return None if value is None else getattr(datetime.date.fromisoformat(str(value)[:10]), part)
+    return extract
+
+
+# Function to read a money value, arithmetic in SQLite stores its result with no trailing zeros
+def sqlite_money(value):
+    return Decimal(value.decode()).quantize(Decimal("0.01"))
+
+
+# Function to compare two money values stored as text by their amount
+def sqlite_decimal_collation(left, right):
+    left, right = Decimal(left), Decimal(right)
+    return (left > right) - (left < right)
+
+
+# Aggregate replacing SUM on SQLite, money is added up as Decimal instead of binary floating point
+class SQLiteDecimalSum:
+    def __init__(self):
+        self.total = None
+
+    def step(self, value):
+        if value is None:
+            return
+        if isinstance(value, str):
+            value = Decimal(value)
+        self.total = value if self.total is None else self.total + value
+
+    def finalize(self):
+        if isinstance(self.total, Decimal):
+            return str(self.total.quantize(Decimal("0.01")) if self.total.as_tuple().exponent > -2 else self.total)
+        return self.total
+
+
+# Function to read a sum, money totals come back as decimal text and whole number totals as integers
+def sqlite_sum(value):
+    value = value.decode()
+    return Decimal(value) if "." in value else int(value)
+
+
+# Class storing the library in an embedded SQLite database file, in WAL mode so readers are never blocked by
+# the single writer. Every thread keeps its own connections, which keep their compiled statements
+class SQLiteBackend:
+    name = "sqlite"
+    integrity_error = sqlite3.IntegrityError
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self.local = threading.local()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                                     detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                                     cached_statements=SQLITE_STATEMENT_CACHE)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.create_collation("DECIMAL", sqlite_decimal_collation)
+        connection.create_aggregate("DECIMAL_SUM", 1, SQLiteDecimalSum)
+        connection.create_function("DATEDIFF", 2, sqlite_datediff, deterministic=True)
+        connection.create_function("YEAR", 1, sqlite_date_part("year"), deterministic=True)
+        connection.create_function("MONTH", 1, sqlite_date_part("month"), deterministic=True)
+        return connection
+
+    # Hand out one of this thread's idle connections, opening another one when an operation nests a cursor
+    @contextmanager
+    def connection(self):
+        if getattr(self.local, "pid", None) != os.getpid():
+            self.local.pid = os.getpid()
+            self.local.idle = []
+        connection = self.local.idle.pop() if self.local.idle else self.connect()
+        try:
+            yield connection
+        finally:
+            self.local.idle.append(connection)
+
+    def reset(self):
+        self.local = threading.local()
+
+    # Take the write lock when the transaction starts, so a transaction never fails halfway waiting for it
+    def begin(self, connection):
+        connection.execute("BEGIN IMMEDIATE")
+
+    @functools.lru_cache(maxsize=1024)
+    def translate(self, query):
+        for pattern, replacement in SQLITE_QUERY_REWRITES:
+            query = pattern.sub(replacement, query)
+        return query
+
+    # Rewrite a migration statement for SQLite, returns the statements to run in its place
+    def schema_statements(self, statement):
+        # Full-text indexes and column resizing have no SQLite equivalent, the search uses its own query
+        if re.search(r"\bFULLTEXT\b|\bALTER TABLE \w+ MODIFY\b", statement):
+            return []
+        for pattern, replacement in SQLITE_SCHEMA_REWRITES:
+            statement = pattern.sub(replacement, statement)
+        # SQLite adds one column per ALTER TABLE statement
+        match = re.match(r"\s*ALTER TABLE (\w+)\s+(ADD COLUMN .*)", statement, re.S)
+        if match:
+            return [f"ALTER TABLE {match.group(1)} {column.strip()}"
+                    for column in re.split(r",\s*(?=ADD COLUMN)", match.group(2))]
+        return [statement]
+
+    def has_index(self, cursor, table, index):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+                       (table, index))
+        return cursor.fetchone() is not None
+
+    def has_column(self, cursor, table, column):
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row[1].lower() == column.lower() for row in cursor.fetchall())
+
+    def explain(self, cursor, query, params):
+        cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+        plans = []
+        for row in cursor.fetchall():
+            detail = row[-1]
+            words = detail.split()
+            table = words[1] if len(words) > 1 and words[0] in ("SCAN", "SEARCH") else None
+            index = detail.split(" INDEX ", 1)[1].split()[0] if " INDEX " in detail else None
+            # SCAN without an index reads every row of the table
+            plans.append((table, detail, index, None, words[0] == "SCAN" and index is None and table is not None))
+        return plans
+
+
+# Decimal and date values are passed as text and read back with their declared column type, money columns keep
+# the text while other DECIMAL columns have NUMERIC affinity and store a floating point number
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("MONEY", sqlite_money)
+sqlite3.register_converter("SUM", sqlite_sum)
+sqlite3.register_converter("DECIMAL", lambda value: Decimal(value.decode()))
+sqlite3.register_converter("DATE", lambda value: datetime.date.fromisoformat(value.decode()))
+sqlite3.register_converter("DATETIME", lambda value: datetime.datetime.fromisoformat(value.decode()))
+
+STORAGE_BACKENDS = {"mysql": MySQLBackend, "sqlite": SQLiteBackend}
+
+# The backend used by every function in the module
+storage = STORAGE_BACKENDS[DB_BACKEND]()
+
+
+# Function to get a database connection from the configured backend
+@contextmanager
+def get_connection():
+    with storage.connection() as connection:
+        yield connection
+
+
+# Statements slower than this many milliseconds are written to the slow query log
+SLOW_QUERY_MS = float(os.environ.get("LIBRARY_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_FILE = os.environ.get("LIBRARY_SLOW_QUERY_LOG", "slow_queries.log")
+
+# Upper bounds, in milliseconds, of the latency histogram buckets
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+query_log = logging.getLogger("library.queries")
+
+
+# Function to send the slow query and query error log to SLOW_QUERY_LOG_FILE, so it does not mix with the menus
+def configure_query_log():
+    if not query_log.handlers:
+        handler = logging.FileHandler(SLOW_QUERY_LOG_FILE, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        query_log.addHandler(handler)
+        query_log.setLevel(logging.INFO)
+        query_log.propagate = False
+
+
+# Class to aggregate latencies into a count, a sum, a maximum and histogram buckets
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.round_trips = 0
+        self.db_ms = 0.0
+        # One counter per bucket in LATENCY_BUCKETS_MS plus one for slower calls
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+
+# Latency statistics per query name and per user operation, guarded by stats_lock
+query_stats = {}
+operation_stats = {}
+stats_lock = threading.Lock()
+
+# Statistics of the user operation running in the current thread or task, see track_operation()
+current_operation = contextvars.ContextVar("current_operation", default=None)
+
+# Query names resolved so far, keyed by statement text
+query_name_cache = {}
+
+
+# Function to name a statement after the module constant it was built from (FIND_AUTHOR_QUERY -> find_author)
+# Other statements are named by their verb and first table, for example "select Book"
+def query_name(query):
+    name = query_name_cache.get(query)
+    if name is not None:
+        return name
+
+    best = ""
+    for constant, value in globals().items():
+        if not constant.endswith("_QUERY") or not isinstance(value, str):
+            continue
+        if query.startswith(value) and len(value) > len(best):
+            best = value
+            name = constant[:-len("_QUERY")].lower()
+
+    if name is None:
+        match = re.match(r"\s*(\w+)(?:.*?\b(?:FROM|INTO|UPDATE|TABLE|INDEX \w+ ON)\s+(\w+))?", query, re.S | re.I)
+        name = f"{match.group(1).lower()} {match.group(2) or ''}".strip() if match else "unknown"
+
+    # The cache is capped because statements built with a variable number of placeholders are all distinct
+    if len(query_name_cache) < 1000:
+        query_name_cache[query] = name
+    return name
+
+
+# Function to record one database round trip against the query and the current user operation
+def record_query(name, elapsed_ms, rows=0, error=None, query=None):
+    with stats_lock:
+        stats = query_stats.get(name)
+        if stats is None:
+            stats = query_stats[name] = LatencyStats()
+        stats.add(elapsed_ms)
+        stats.rows += rows
+        stats.round_trips += 1
+        if error is not None:
+            stats.errors += 1
+
+    operation = current_operation.get()
+    if operation is not None:
+        operation["round_trips"] += 1
+        operation["db_ms"] += elapsed_ms
+
+    if error is not None:
+        query_log.error("%s failed after %.1f ms: %s", name, elapsed_ms, error)
+    elif elapsed_ms >= SLOW_QUERY_MS:
+        statement = " ".join((query or name).split())
+        query_log.warning("slow query %s took %.1f ms: %s", name, elapsed_ms, statement)
+
+
+# Function to add rows read by a fetch to a query's statistics
+def record_rows(name, rows):
+    with stats_lock:
+        stats = query_stats.get(name)
+        if stats is not None:
+            stats.rows += rows
+
+
+# Decorator to measure a user operation: wall time plus the round trips and database time of every query it runs
+# Operations started inside another operation are counted as part of the outer one. Only functions that never
+# wait at a prompt are decorated, so the menus' typing time does not end up in the operation statistics
+def track_operation(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if current_operation.get() is not None:
+            return function(*args, **kwargs)
+
+        operation = {"round_trips": 0, "db_ms": 0.0}
+        token = current_operation.set(operation)
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            current_operation.reset(token)
+            with stats_lock:
+                stats = operation_stats.get(function.__name__)
+                if stats is None:
+                    stats = operation_stats[function.__name__] = LatencyStats()
+                stats.add(elapsed_ms)
+                stats.round_trips += operation["round_trips"]
+                stats.db_ms += operation["db_ms"]
+    return wrapper
+
+
+# Class wrapping a database cursor so every statement is timed and counted
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.name = None
+
+    def run(self, method, query, params):
+        self.name = query_name(query)
+        started = time.perf_counter()
+        try:
+            result = method(storage.translate(query), params)
+        except Exception as e:
+            record_query(self.name, (time.perf_counter() - started) * 1000, error=e, query=query)
+            raise
+        # Rows changed by a write are known now, rows of a SELECT are counted as they are fetched
+        rows = max(self.cursor.rowcount, 0) if self.cursor.description is None else 0
+        record_query(self.name, (time.perf_counter() - started) * 1000, rows, query=query)
+        return result
+
+    def execute(self, query, params=()):
+        return self.run(self.cursor.execute, query, params)
+
+    def executemany(self, query, seq_params):
+        return self.run(self.cursor.executemany, query, seq_params)
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            record_rows(self.name, 1)
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self.cursor.fetchmany(size)
+        record_rows(self.name, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        record_rows(self.name, len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, attribute):
+        return getattr(self.cursor, attribute)
+
+
+# Function to get a cursor on a pooled connection for a single operation
+# With commit=True the work is committed on success, any error rolls the transaction back
+@contextmanager
+def get_cursor(commit=False):
+    with get_connection() as connection:
+        cursor = InstrumentedCursor(connection.cursor())
+        try:
+            if commit:
+                storage.begin(connection)
+            yield cursor
+            if commit:
+                started = time.perf_counter()
+                connection.commit()
+                record_query("commit", (time.perf_counter() - started) * 1000)
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+# Function to return the collected statistics as tables of rows, (query rows, operation rows)
+def query_stats_rows():
+    with stats_lock:
+        queries = [[name, stats.count, stats.errors, f"{stats.total_ms / stats.count:.2f}", f"{stats.max_ms:.2f}",
+                    f"{stats.total_ms:.1f}", stats.rows]
+                   for name, stats in sorted(query_stats.items(), key=lambda item: -item[1].total_ms)]
+        operations = [[name, stats.count, f"{stats.total_ms / stats.count:.1f}",
+                       f"{stats.round_trips / stats.count:.1f}", f"{stats.db_ms / stats.count:.1f}"]
+                      for name, stats in sorted(operation_stats.items())]
+    return queries, operations
+
+
+# Function to render the collected statistics in the Prometheus text format
+def query_stats_prometheus():
+    lines = ["# TYPE library_query_duration_seconds histogram"]
+    with stats_lock:
+        for name, stats in sorted(query_stats.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS_MS + ("+Inf",), stats.buckets):
+                cumulative += count
+                le = bound if bound == "+Inf" else bound / 1000
+                lines.append(f'library_query_duration_seconds_bucket{{query="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'library_query_duration_seconds_sum{{query="{name}"}} {stats.total_ms / 1000:.6f}')
+            lines.append(f'library_query_duration_seconds_count{{query="{name}"}} {stats.count}')
+
+        lines.append("# TYPE library_query_rows_total counter")
+        lines += [f'library_query_rows_total{{query="{name}"}} {stats.rows}'
+                  for name, stats in sorted(query_stats.items())]
+        lines.append("# TYPE library_query_errors_total counter")
+        lines += [f'library_query_errors_total{{query="{name}"}} {stats.errors}'
+                  for name, stats in sorted(query_stats.items())]
+
+        lines.append("# TYPE library_operations_total counter")
+        lines += [f'library_operations_total{{operation="{name}"}} {stats.count}'
+                  for name, stats in sorted(operation_stats.items())]
+        lines.append("# TYPE library_operation_round_trips_total counter")
+        lines += [f'library_operation_round_trips_total{{operation="{name}"}} {stats.round_trips}'
+                  for name, stats in sorted(operation_stats.items())]
+        lines.append("# TYPE library_operation_db_seconds_total counter")
+        lines += [f'library_operation_db_seconds_total{{operation="{name}"}} {stats.db_ms / 1000:.3f}'
+                  for name, stats in sorted(operation_stats.items())]
+    return "\n".join(lines) + "\n"
+
+
+# Function to show the collected statistics, optionally writing them to a file in the Prometheus text format
+def view_query_stats():
+    try:
+        queries, operations = query_stats_rows()
+        if not queries:
+            print("No queries have been run yet.")
+            return
+
+        print("\nQueries:")
+        print(tabulate(queries, headers=["Query", "Calls", "Errors", "Mean ms", "Max ms", "Total ms", "Rows"],
+                       tablefmt="grid"))
+        if operations:
+            print("\nOperations:")
+            print(tabulate(operations, headers=["Operation", "Calls", "Mean ms", "Round Trips/Call", "DB ms/Call"],
+                           tablefmt="grid"))
+
+        path = input("Write Prometheus metrics to file (leave blank to skip): ").strip()
+        if path:
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(query_stats_prometheus())
+            print(f"---->Metrics written to {path}<----")
+    except Exception as e:
+        print("Error:", e)
 
 
-# Function to validate password
-def validate_password(password):
-    if len(password) < 8 or len(password) > 24:
-        print("Password must be between 8 and 24 characters long.")
-        return False
-    if not re.search(r'[A-Z]', password):
-        print("Password must contain at least one uppercase letter.")
-        return False
-    if not re.search(r'[0-9]', password):
-        print("Password must contain at least one digit.")
-        return False
-    if not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
-        print("Password must contain at least one special character.")
+# Query filling the BookListing table from the normalized tables, with the rental count of every book
+REBUILD_BOOK_LISTING_QUERY = """
+INSERT INTO BookListing (BookID, Title, AuthorName, GenreName, RentPrice, Rentals)
+SELECT Book.BookID, Book.Title, Author.Name, Genre.Name, Book.RentPrice, COUNT(Checkout.CheckoutID)
+FROM Book
+JOIN Author ON Book.AuthorID = Author.AuthorID
+JOIN Genre ON Book.GenreID = Genre.GenreID
+LEFT JOIN Checkout ON Checkout.BookID = Book.BookID
+GROUP BY Book.BookID, Book.Title, Author.Name, Genre.Name, Book.RentPrice
+"""
+
+# Schema migrations applied in order by migrate_schema(), each entry is (version, statements)
+# Applied versions are recorded in the SchemaVersion table, so new changes go in a new entry
+SCHEMA_MIGRATIONS = [
+    (1, [
+        # create author table
+        """
+            CREATE TABLE IF NOT EXISTS Author (
+                AuthorID INT AUTO_INCREMENT PRIMARY KEY,
+                Name VARCHAR(100)
+            )
+        """,
+
+        # create genre table
+        """
+            CREATE TABLE IF NOT EXISTS Genre (
+                GenreID INT AUTO_INCREMENT PRIMARY KEY,
+                Name VARCHAR(50)
+            )
+        """,
+
+        # create book table
+        """
+            CREATE TABLE IF NOT EXISTS Book (
+                BookID INT AUTO_INCREMENT PRIMARY KEY,
+                Title VARCHAR(256),
+                AuthorID INT,
+                GenreID INT,
+                RentPrice DECIMAL(10,2),
+                FOREIGN KEY (AuthorID) REFERENCES Author(AuthorID),
+                FOREIGN KEY (GenreID) REFERENCES Genre(GenreID)
+            )
+        """,
+
+        # create login table
+        """
+            CREATE TABLE IF NOT EXISTS Login (
+                Username VARCHAR(50) PRIMARY KEY,
+                Password VARCHAR(50),
+                FirstName VARCHAR(50),
+                LastName VARCHAR(50),
+                Email VARCHAR(50),
+                Role ENUM('admin', 'customer') NOT NULL
+            )
+        """,
+
+        # create plan table
+        """
+            CREATE TABLE IF NOT EXISTS Plan (
+                PlanID INT AUTO_INCREMENT PRIMARY KEY,
+                Duration VARCHAR(255),
+                Cost DECIMAL(10,2),
+                Details VARCHAR(500)
+            )
+        """,
+
+        # create payment table
+        """
+            CREATE TABLE IF NOT EXISTS Payment (
+                PaymentID INT AUTO_INCREMENT PRIMARY KEY,
+                UserID VARCHAR(50),
+                Amount DECIMAL(10,2),
+                PaymentDate DATE,
+                PaymentMethod VARCHAR(255),
+                FOREIGN KEY (UserID) REFERENCES Login(Username)
+            )
+        """,
+
+        # create checkout table
+        """
+            CREATE TABLE IF NOT EXISTS Checkout (
+                CheckoutID INT AUTO_INCREMENT PRIMARY KEY,
+                UserID VARCHAR(50),
+                BookID INT,
+                PlanID INT,
+                Rating VARCHAR(255),
+                ReviewDate DATE,
+                FOREIGN KEY (UserID) REFERENCES Login(Username),
+                FOREIGN KEY (BookID) REFERENCES Book(BookID),
+                FOREIGN KEY (PlanID) REFERENCES Plan(PlanID)
+            )
+        """,
+    ]),
+    (2, [
+        # indexes for the name lookups in add_book()
+        "CREATE UNIQUE INDEX idx_author_name ON Author (Name)",
+        "CREATE UNIQUE INDEX idx_genre_name ON Genre (Name)",
+        # index for the customer listing
+        "CREATE INDEX idx_login_role ON Login (Role)",
+        # indexes for per-user payment and checkout history
+        "CREATE INDEX idx_payment_user_date ON Payment (UserID, PaymentDate)",
+        "CREATE INDEX idx_checkout_user_book ON Checkout (UserID, BookID)",
+    ]),
+    (3, [
+        # full-text indexes for book search
+        "CREATE FULLTEXT INDEX ft_book_title ON Book (Title)",
+        "CREATE FULLTEXT INDEX ft_author_name ON Author (Name)",
+    ]),
+    (4, [
+        # index for date range filters on payments
+        "CREATE INDEX idx_payment_date ON Payment (PaymentDate)",
+    ]),
+    (5, [
+        # summary tables for the reports, filled incrementally by refresh_report_summaries()
+        """
+            CREATE TABLE IF NOT EXISTS DailyRevenue (
+                PaymentDate DATE,
+                PaymentMethod VARCHAR(255),
+                Revenue DECIMAL(14,2),
+                Payments INT,
+                PRIMARY KEY (PaymentDate, PaymentMethod)
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS DailyBookRentals (
+                RentalDate DATE,
+                BookID INT,
+                Rentals INT,
+                PRIMARY KEY (RentalDate, BookID)
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS ReportWatermark (
+                ReportName VARCHAR(50) PRIMARY KEY,
+                LastID INT
+            )
+        """,
+        "INSERT IGNORE INTO ReportWatermark (ReportName, LastID) VALUES ('revenue', 0), ('rentals', 0)",
+    ]),
+    (6, [
+        # inventory, every book starts with one copy
+        """
+            ALTER TABLE Book
+                ADD COLUMN Copies INT NOT NULL DEFAULT 1,
+                ADD COLUMN AvailableCopies INT NOT NULL DEFAULT 1
+        """,
+        # loan due and return dates
+        """
+            ALTER TABLE Checkout
+                ADD COLUMN DueDate DATE NULL,
+                ADD COLUMN ReturnDate DATE NULL
+        """,
+        # rentals made before loans were tracked are treated as returned, they are the ones without a due date
+        "UPDATE Checkout SET ReturnDate = ReviewDate WHERE BookID IS NOT NULL AND DueDate IS NULL",
+        # index for active and overdue loan lookups
+        "CREATE INDEX idx_checkout_return_due ON Checkout (ReturnDate, DueDate)",
+    ]),
+    (7, [
+        # last day an overdue loan has been fined for
+        "ALTER TABLE Checkout ADD COLUMN FinedThrough DATE NULL",
+        # progress of the fine sweep, one row per day and UserID range
+        """
+            CREATE TABLE IF NOT EXISTS FineSweepProgress (
+                SweepDate DATE,
+                PartitionKey VARCHAR(120),
+                LastCheckoutID INT NOT NULL DEFAULT 0,
+                Completed BOOLEAN NOT NULL DEFAULT FALSE,
+                PRIMARY KEY (SweepDate, PartitionKey)
+            )
+        """,
+    ]),
+    (8, [
+        # room for password hashes, existing plaintext passwords are rehashed at their next login
+        "ALTER TABLE Login MODIFY Password VARCHAR(255)",
+    ]),
+    (9, [
+        # denormalized book listing read by view_books, kept current by the functions that change books or rent them
+        """
+            CREATE TABLE IF NOT EXISTS BookListing (
+                BookID INT PRIMARY KEY,
+                Title VARCHAR(256),
+                AuthorName VARCHAR(100),
+                GenreName VARCHAR(50),
+                RentPrice DECIMAL(10,2),
+                Rentals INT NOT NULL DEFAULT 0
+            )
+        """,
+        "DELETE FROM BookListing",
+        REBUILD_BOOK_LISTING_QUERY,
+    ]),
+    (10, [
+        # precomputed "readers also rented" books, rebuilt by build_recommendations()
+        """
+            CREATE TABLE IF NOT EXISTS BookRecommendation (
+                BookID INT,
+                Position INT,
+                RecommendedBookID INT,
+                Score DECIMAL(8,6),
+                PRIMARY KEY (BookID, Position)
+            )
+        """,
+        # indexes for the most rented books overall and within a genre
+        "CREATE INDEX idx_listing_rentals ON BookListing (Rentals)",
+        "CREATE INDEX idx_listing_genre_rentals ON BookListing (GenreName, Rentals)",
+    ]),
+    (11, [
+        # append-only record of who changed the catalog, rentals and payments, written by the audit log thread
+        """
+            CREATE TABLE IF NOT EXISTS AuditLog (
+                EventID INT AUTO_INCREMENT PRIMARY KEY,
+                EventTime DATETIME NOT NULL,
+                Actor VARCHAR(50),
+                Action VARCHAR(50),
+                Entity VARCHAR(50),
+                EntityID VARCHAR(50),
+                OldValue TEXT,
+                NewValue TEXT
+            )
+        """,
+        "CREATE INDEX idx_audit_entity ON AuditLog (Entity, EntityID)",
+        "CREATE INDEX idx_audit_time ON AuditLog (EventTime)",
+    ]),
+    (12, [
+        # highest ID seen past a gap in a summarized table and when, see refresh_report_summaries()
+        """
+            ALTER TABLE ReportWatermark
+                ADD COLUMN PendingID INT NOT NULL DEFAULT 0,
+                ADD COLUMN PendingAt DATETIME NULL
+        """,
+    ]),
+]
+
+# Set once the schema has been checked in this process
+schema_ready = False
+
+CREATE_INDEX_PATTERN = re.compile(r"\s*CREATE\s+(?:UNIQUE\s+|FULLTEXT\s+)?INDEX\s+(\w+)\s+ON\s+(\w+)", re.I)
+ADD_COLUMNS_PATTERN = re.compile(r"\s*ALTER TABLE (\w+)\s+(ADD COLUMN .*)", re.S)
+
+
+# Function to leave out the parts of a migration statement that are already applied, returns None when nothing
+# is left. MySQL commits every index and column change at once, so a version that failed halfway has kept its
+# earlier changes without being recorded, and running it again must skip them instead of failing on them
+def pending_schema_change(cursor, statement):
+    match = CREATE_INDEX_PATTERN.match(statement)
+    if match:
+        return None if storage.has_index(cursor, match.group(2), match.group(1)) else statement
+    match = ADD_COLUMNS_PATTERN.match(statement)
+    if match:
+        columns = [column.strip() for column in re.split(r",\s*(?=ADD COLUMN)", match.group(2))]
+        missing = [column for column in columns if not storage.has_column(cursor, match.group(1), column.split()[2])]
+        return f"ALTER TABLE {match.group(1)} " + ", ".join(missing) if missing else None
+    return statement
+
+
+# Function to create or upgrade the database tables, skipped when the stored schema version is current
+def migrate_schema():
+    global schema_ready
+    if schema_ready:
+        return
+
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS SchemaVersion (
+                Version INT PRIMARY KEY,
+                AppliedAt DATETIME
+            )
+        """)
+        cursor.execute("SELECT MAX(Version) FROM SchemaVersion")
+        current_version = cursor.fetchone()[0] or 0
+
+        for version, statements in SCHEMA_MIGRATIONS:
+            if version <= current_version:
+                continue
+            for statement in statements:
+                statement = pending_schema_change(cursor, statement)
+                if statement is None:
+                    continue
+                for backend_statement in storage.schema_statements(statement):
+                    cursor.execute(backend_statement)
+            cursor.execute("INSERT INTO SchemaVersion (Version, AppliedAt) VALUES (%s, %s)",
+                           (version, datetime.datetime.now()))
+            print(f"Database schema upgraded to version {version}.")
+
+    schema_ready = True
+
+
+# Where audit events are written: "table" for the AuditLog table or "file" for a rotating JSON Lines file
+AUDIT_LOG_TARGET = os.environ.get("LIBRARY_AUDIT_LOG_TARGET", "table")
+AUDIT_LOG_FILE = os.environ.get("LIBRARY_AUDIT_LOG_FILE", "audit.log")
+AUDIT_LOG_FILE_BYTES = int(os.environ.get("LIBRARY_AUDIT_LOG_FILE_BYTES", str(10 * 1024 * 1024)))
+AUDIT_LOG_FILE_BACKUPS = int(os.environ.get("LIBRARY_AUDIT_LOG_FILE_BACKUPS", "5"))
+
+# Most events held in memory, most events written together, and seconds an event may wait for its batch
+AUDIT_QUEUE_SIZE = int(os.environ.get("LIBRARY_AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.environ.get("LIBRARY_AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get("LIBRARY_AUDIT_FLUSH_INTERVAL", "1"))
+
+# Seconds a change waits for room in a full buffer before its event is dropped
+AUDIT_ENQUEUE_TIMEOUT = 1.0
+
+AUDIT_FIELDS = ["EventTime", "Actor", "Action", "Entity", "EntityID", "OldValue", "NewValue"]
+INSERT_AUDIT_QUERY = f"INSERT INTO AuditLog ({', '.join(AUDIT_FIELDS)}) VALUES ({', '.join(['%s'] * len(AUDIT_FIELDS))})"
+
+# User making the changes of the current menu session or API request, recorded as the actor of audit events
+current_actor = contextvars.ContextVar("current_actor", default=None)
+
+audit_file_log = logging.getLogger("library.audit")
+
+
+# Function to send audit events to the rotating AUDIT_LOG_FILE, one JSON object per line
+def configure_audit_file():
+    if not audit_file_log.handlers:
+        handler = RotatingFileHandler(AUDIT_LOG_FILE, maxBytes=AUDIT_LOG_FILE_BYTES,
+                                      backupCount=AUDIT_LOG_FILE_BACKUPS, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        audit_file_log.addHandler(handler)
+        audit_file_log.setLevel(logging.INFO)
+        audit_file_log.propagate = False
+
+
+# Class implementing a write-behind audit log: changes queue their events in a bounded in-memory buffer and
+# a background thread writes them in batches, so a change never waits for its audit write
+# Events are only recorded once the change has been committed
+class AuditLog:
+    FLUSH = object()
+
+    def __init__(self, target=AUDIT_LOG_TARGET):
+        self.target = target
+        self.queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="audit-log", daemon=True)
+                self.thread.start()
+
+    # Queue an event, actor defaults to the current menu or API user
+    def record(self, action, entity, entity_id, old_value=None, new_value=None, actor=None):
+        event = (datetime.datetime.now(), actor or current_actor.get() or "system", action, entity, str(entity_id),
+                 None if old_value is None else json.dumps(old_value, default=str),
+                 None if new_value is None else json.dumps(new_value, default=str))
+        self.start()
+        try:
+            # A full buffer slows changes down briefly rather than growing without bound
+            self.queue.put(event, timeout=AUDIT_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            query_log.error("Audit buffer full, event dropped: %s", event)
+
+    # Background thread: collect events until the batch is full or has waited AUDIT_FLUSH_INTERVAL, then write it
+    # A FLUSH marker writes the batch at once and None stops the thread once the batch is written
+    def run(self):
+        stop = False
+        while not stop:
+            batch = []
+            markers = 0
+            event = self.queue.get()
+            deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL
+            while True:
+                if event is None or event is self.FLUSH:
+                    markers = 1
+                    stop = event is None
+                    break
+                batch.append(event)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= AUDIT_BATCH_SIZE or remaining <= 0:
+                    break
+                try:
+                    event = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self.write(batch)
+            for _ in range(len(batch) + markers):
+                self.queue.task_done()
+
+    # Write a batch to the AuditLog table in one transaction, or to the file when that is the target or the
+    # table cannot be written, so events are not lost while the database is unavailable
+    def write(self, batch):
+        if self.target == "table":
+            try:
+                with get_cursor(commit=True) as cursor:
+                    cursor.executemany(INSERT_AUDIT_QUERY, batch)
+                self.written += len(batch)
+                return
+            except Exception as e:
+                query_log.error("Audit events written to %s, the AuditLog table failed: %s", AUDIT_LOG_FILE, e)
+
+        configure_audit_file()
+        for event in batch:
+            audit_file_log.info(json.dumps(dict(zip(AUDIT_FIELDS, event)), default=str))
+        self.written += len(batch)
+
+    # Block until every queued event has been written
+    def flush(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(self.FLUSH)
+            self.queue.join()
+
+    # Write the remaining events and stop the thread, runs when the process exits
+    def close(self, timeout=10):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
+
+
+audit_log = AuditLog()
+atexit.register(audit_log.close)
+
+
+# Patterns used by the validation rules, compiled once when the module is loaded
+UPPERCASE_PATTERN = re.compile(r'[A-Z]')
+DIGIT_PATTERN = re.compile(r'[0-9]')
+SPECIAL_CHARACTER_PATTERN = re.compile(r'[!@#$%^&*(),.?":{}|<>]')
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+
+# Longest value the Username, FirstName, LastName and Email columns hold
+MAX_FIELD_LENGTH = 50
+
+
+def fits_column(value):
+    return len(value) <= MAX_FIELD_LENGTH
+
+
+# Validation rules for each kind of value, every rule is (check, error message)
+# Rules run in order and a value is reported with the first rule it fails
+VALIDATION_RULES = {
+    "password": [
+        (lambda value: 8 <= len(value) <= 24, "Password must be between 8 and 24 characters long."),
+        (UPPERCASE_PATTERN.search, "Password must contain at least one uppercase letter."),
+        (DIGIT_PATTERN.search, "Password must contain at least one digit."),
+        (SPECIAL_CHARACTER_PATTERN.search, "Password must contain at least one special character."),
+    ],
+    "username": [
+        (str.isalnum, "Username must be alphanumeric (letters and numbers only)."),
+        (fits_column, f"Username must be at most {MAX_FIELD_LENGTH} characters long."),
+    ],
+    "name": [
+        (lambda value: len(value) >= 3 and value.isalpha(),
+         "Name must be at least 3 characters long and contain only alphabets."),
+        (fits_column, f"Name must be at most {MAX_FIELD_LENGTH} characters long."),
+    ],
+    "email": [
+        (EMAIL_PATTERN.fullmatch, "Email must contain '@' and '.'"),
+        (fits_column, f"Email must be at most {MAX_FIELD_LENGTH} characters long."),
+    ],
+    "role": [
+        (lambda value: value in ("admin", "customer"), "Role must be 'admin' or 'customer'."),
+    ],
+}
+
+# Fields of a Login record and the kind of value each one holds
+LOGIN_FIELDS = {
+    "FirstName": "name",
+    "LastName": "name",
+    "Username": "username",
+    "Email": "email",
+    "Password": "password",
+    "Role": "role",
+}
+
+
+# Error raised when a record fails validation, errors holds every (field, message) pair
+class ValidationError(ValueError):
+    def __init__(self, errors):
+        super().__init__(" ".join(message for field, message in errors))
+        self.errors = errors
+
+
+# Function to check a single value, returns the error message of the first failed rule or None when it is valid
+def check_value(kind, value):
+    if not isinstance(value, str):
+        return "Value must be text."
+    for check, message in VALIDATION_RULES[kind]:
+        if not check(value):
+            return message
+    return None
+
+
+# Function to validate every field of a record, returns a list of (field, message) errors that is empty when valid
+def validate_record(record, fields=LOGIN_FIELDS):
+    errors = []
+    for field, kind in fields.items():
+        value = record.get(field)
+        if value is None or value == "":
+            errors.append((field, f"{field} is required."))
+            continue
+        message = check_value(kind, value)
+        if message:
+            errors.append((field, message))
+    return errors
+
+
+# Function to validate records one at a time, yields (record, errors) so any number of records can be checked
+# without holding them in memory
+def validate_records(records, fields=LOGIN_FIELDS):
+    for record in records:
+        yield record, validate_record(record, fields)
+
+
+# Function to print the error of an interactively entered value, returns True when the value is valid
+def report_invalid(kind, value):
+    message = check_value(kind, value)
+    if message:
+        print(message)
         return False
     return True
 
 
+# Function to validate password
+def validate_password(password):
+    return report_invalid("password", password)
+
+
 # Function to validate username
 def validate_username(username):
-    if not username.isalnum():
-        print("Username must be alphanumeric (letters and numbers only).")
-        return False
-    return True
+    return report_invalid("username", username)
 
 
 # Function to validate name (alphabets only, min 3 characters)
 def validate_name(name):
-    if len(name) < 3 or not name.isalpha():
-        print("Name must be at least 3 characters long and contain only alphabets.")
-        return False
-    return True
+    return report_invalid("name", name)
 
 
 # Function to validate email
 def validate_email(email):
-    if not re.fullmatch(r"[^@]+@[^@]+\.[^@]+", email):
-        print("Email must contain '@' and '.'")
-        return False
-    return True
+    return report_invalid("email", email)
+
+
+# PBKDF2 cost, raising it makes new and rehashed passwords slower to check and to crack
+PASSWORD_HASH_ITERATIONS = int(os.environ.get("LIBRARY_PASSWORD_HASH_ITERATIONS", "600000"))
+PASSWORD_HASH_ALGORITHM = "pbkdf2_sha256"
+
+# hashlib releases the GIL while deriving a key, so hashes run in parallel on these threads
+# without blocking the threads that serve other requests
+PASSWORD_HASH_WORKERS = int(os.environ.get("LIBRARY_PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+
+def derive_key(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+
+def format_hash(iterations, salt, key):
+    return "$".join([PASSWORD_HASH_ALGORITHM, str(iterations), base64.b64encode(salt).decode("ascii"),
+                     base64.b64encode(key).decode("ascii")])
+
+
+# Function to hash a password for storage as "pbkdf2_sha256$iterations$salt$hash"
+def hash_password(password, iterations=None):
+    iterations = iterations or PASSWORD_HASH_ITERATIONS
+    salt = os.urandom(16)
+    key = password_executor.submit(derive_key, password, salt, iterations).result()
+    return format_hash(iterations, salt, key)
+
+
+# Function to hash a batch of passwords, the keys are derived in parallel on the hash workers
+def hash_passwords(passwords, iterations=None):
+    iterations = iterations or PASSWORD_HASH_ITERATIONS
+    salts = [os.urandom(16) for _ in passwords]
+    keys = password_executor.map(derive_key, passwords, salts, [iterations] * len(passwords))
+    return [format_hash(iterations, salt, key) for salt, key in zip(salts, keys)]
+
+
+# Function to split a stored value into (iterations, salt, key), returns None unless it is a well formed hash:
+# at least one iteration, a salt and a SHA-256 sized key, both strictly base64 encoded
+def parse_password_hash(value):
+    parts = value.split("$") if isinstance(value, str) else []
+    if len(parts) != 4 or parts[0] != PASSWORD_HASH_ALGORITHM or not (parts[1].isascii() and parts[1].isdigit()):
+        return None
+    try:
+        salt = base64.b64decode(parts[2], validate=True)
+        key = base64.b64decode(parts[3], validate=True)
+    except ValueError:
+        return None
+    if int(parts[1]) < 1 or not salt or len(key) != hashlib.sha256().digest_size:
+        return None
+    return int(parts[1]), salt, key
+
+
+# Function to tell whether a stored value is already a password hash rather than a plaintext password
+def is_password_hash(value):
+    return parse_password_hash(value) is not None
+
+
+# Function to check a password against a stored value, returns (matches, needs_rehash)
+# Values that are not in the hash format are plaintext passwords from before hashing was introduced
+def verify_password(password, stored):
+    parsed = parse_password_hash(stored)
+    if parsed is None:
+        return hmac.compare_digest(password.encode("utf-8"), (stored or "").encode("utf-8")), True
+
+    iterations, salt, stored_key = parsed
+    key = password_executor.submit(derive_key, password, salt, iterations).result()
+    return hmac.compare_digest(key, stored_key), iterations != PASSWORD_HASH_ITERATIONS
+
+
+# Class implementing an in-memory token bucket per key: each failure takes a token and tokens come back
+# at refill_rate per second up to capacity, a key with no token left is refused
+class TokenBucketLimiter:
+    def __init__(self, capacity, refill_rate, max_keys=100000):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_keys = max_keys
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def tokens(self, key, now):
+        tokens, updated = self.buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.refill_rate)
+
+    def allow(self, key):
+        with self.lock:
+            return self.tokens(key, time.monotonic()) >= 1
+
+    def consume(self, key):
+        with self.lock:
+            now = time.monotonic()
+            self.buckets[key] = (max(0.0, self.tokens(key, now) - 1), now)
+            if len(self.buckets) > self.max_keys:
+                # Buckets that have refilled are the same as absent ones, dropping them bounds memory
+                self.buckets = {bucket_key: value for bucket_key, value in self.buckets.items()
+                                if self.tokens(bucket_key, now) < self.capacity}
+
+
+# Failed logins allowed per username before it is throttled, and for all usernames together
+# The global bucket keeps a credential stuffing burst over many usernames from saturating the hash workers
+user_login_limiter = TokenBucketLimiter(capacity=5, refill_rate=1 / 60)
+global_login_limiter = TokenBucketLimiter(capacity=int(os.environ.get("LIBRARY_LOGIN_FAILURE_BURST", "100")),
+                                          refill_rate=float(os.environ.get("LIBRARY_LOGIN_FAILURE_RATE", "20")))
+
+
+# Error raised when a login is refused because of too many recent failures
+class LoginThrottledError(Exception):
+    pass
+
+
+# Query used to authenticate a user at login
+LOGIN_QUERY = "SELECT Role, Password FROM Login WHERE Username = %s"
+
+INSERT_LOGIN_QUERY = """
+INSERT INTO Login (Username, Password, FirstName, LastName, Email, Role) 
+VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+# Function to check a username and password, returns the user's role or None when they do not match
+@track_operation
+def authenticate(username, password):
+    if not (user_login_limiter.allow(username) and global_login_limiter.allow("all")):
+        raise LoginThrottledError("Too many failed login attempts. Please try again later.")
+
+    with get_cursor() as cursor:
+        cursor.execute(LOGIN_QUERY, (username,))
+        result = cursor.fetchone()
+
+    matches, needs_rehash = verify_password(password, result[1]) if result else (False, False)
+    if not matches:
+        user_login_limiter.consume(username)
+        global_login_limiter.consume("all")
+        return None
+
+    if needs_rehash:
+        # Upgrade plaintext or outdated hashes, unless the password was changed in the meantime
+        with get_cursor(commit=True) as cursor:
+            cursor.execute("UPDATE Login SET Password = %s WHERE Username = %s AND Password = %s",
+                           (hash_password(password), username, result[1]))
+    return result[0]
+
+
+# Function to create a new login, raises ValidationError when any of the details is invalid
+@track_operation
+def register_user(username, password, first_name, last_name, email, role="customer"):
+    errors = validate_record({"Username": username, "Password": password, "FirstName": first_name,
+                              "LastName": last_name, "Email": email, "Role": role})
+    if errors:
+        raise ValidationError(errors)
+
+    with get_cursor(commit=True) as cursor:
+        cursor.execute(INSERT_LOGIN_QUERY, (username, hash_password(password), first_name, last_name, email, role))
+
+
+# Seconds a session stays valid without being used, and the most sessions kept in memory
+SESSION_TTL = int(os.environ.get("LIBRARY_SESSION_TTL", "1800"))
+SESSION_CACHE_SIZE = int(os.environ.get("LIBRARY_SESSION_CACHE_SIZE", "10000"))
+
+
+# Class describing a logged in user, the token identifies the session to API clients
+class Session:
+    def __init__(self, token, username, role):
+        self.token = token
+        self.username = username
+        self.role = role
+        self.last_seen = time.monotonic()
+
+
+# Class keeping sessions in memory by token, least recently used sessions are dropped when the cache is full
+# and sessions idle for longer than the TTL expire
+class SessionCache:
+    def __init__(self, max_size=SESSION_CACHE_SIZE, ttl=SESSION_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, session):
+        with self.lock:
+            self.sessions[session.token] = session
+            while len(self.sessions) > self.max_size:
+                self.sessions.popitem(last=False)
+
+    # Return the session for a token and mark it as used, or None when it is unknown or expired
+    def get(self, token):
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is None:
+                return None
+            now = time.monotonic()
+            if now - session.last_seen > self.ttl:
+                del self.sessions[token]
+                return None
+            session.last_seen = now
+            self.sessions.move_to_end(token)
+            return session
+
+    def remove(self, token):
+        with self.lock:
+            self.sessions.pop(token, None)
+
+
+sessions = SessionCache()
+
+
+# Error raised when an action is attempted without a valid session or with the wrong role
+class NotAuthorizedError(Exception):
+    pass
+
+
+# Function to open a session for a user who has already been authenticated
+def start_session(username, role):
+    session = Session(secrets.token_urlsafe(32), username, role)
+    sessions.add(session)
+    return session
+
+
+# Function to log a user in, returns a Session or None when the username or password is wrong
+def login(username, password):
+    role = authenticate(username, password)
+    return start_session(username, role) if role else None
+
+
+def logout(session):
+    sessions.remove(session.token)
+    current_actor.set(None)
+
+
+# Function to check that a session is still valid and, when given, has the required role
+# Returns the cached session, the check is a dictionary lookup and never queries the database
+def require_session(session_or_token, role=None):
+    token = session_or_token.token if isinstance(session_or_token, Session) else session_or_token
+    session = sessions.get(token) if token else None
+    if session is None:
+        raise NotAuthorizedError("Your session has expired. Please log in again.")
+    if role and session.role != role:
+        raise NotAuthorizedError(f"This action requires the {role} role.")
+    return session
 
 
 # Function to register new customer
@@ -176,14 +1439,12 @@ def register():
             role = "customer"
 
             # Insert validated data into the database
-            insert_query = """
-            INSERT INTO Login (Username, Password, FirstName, LastName, Email, Role) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(insert_query, (username, password, first_name, last_name, email, role))
-            databaseobj.commit()
+            register_user(username, password, first_name, last_name, email, role)
             print("\t\t\t------You have successfully registered as a customer!------\n")
 
+            # The new customer is logged in straight away
+            session = start_session(username, role)
+
             # Ask user if they want to subscribe to a plan
             subscribe = input("Would you like to subscribe to a plan? (yes): ").strip().lower()
 
@@ -191,66 +1452,507 @@ def register():
                 view_plans()  # Show available plans
                 while True:
                     plan_id = input("Enter the PlanID you want to subscribe to: ")
-                    cursor.execute("SELECT * FROM Plan WHERE PlanID = %s", (plan_id,))
-                    if cursor.fetchone():
+                    plan = plan_cache.get_row(int(plan_id)) if plan_id.isdigit() else None
+                    if plan:
                         # Proceed to checkout with selected plan
-                        checkout_plan(plan_id, username)
+                        checkout_plan(plan_id, session.username)
                         break
                     else:
                         print("Invalid PlanID. Please enter a valid PlanID.")
             else:
                 print("No plan subscription selected.")
 
-            customer_menu()
+            customer_menu(session)
+            logout(session)
             break
         except Exception as e:
             print("Error:", e)
 
 
-# Function to check out with selected plan
-def checkout_plan(plan_id, user_id):
-    # Retrieve the selected plan details for pricing
-    cursor.execute("SELECT Cost FROM Plan WHERE PlanID = %s", (plan_id,))
-    plan_cost = cursor.fetchone()[0]
-
-    # Convert plan_cost to Decimal for accurate monetary calculations
-    plan_cost = Decimal(plan_cost)
+# Default charges added to every rental and plan checkout, pricing rules can replace them per item
+TAX = Decimal(os.environ.get("LIBRARY_TAX", "3.50"))
+SERVICE_FEE = Decimal(os.environ.get("LIBRARY_SERVICE_FEE", "5.00"))
+
+# JSON file holding the pricing rules and discount codes, without the file only the default charges apply
+PRICING_RULES_FILE = os.environ.get("LIBRARY_PRICING_RULES", "pricing_rules.json")
+# Seconds between checks of the rules file for changes, an edited file is picked up without a restart
+PRICING_RELOAD_INTERVAL = float(os.environ.get("LIBRARY_PRICING_RELOAD_INTERVAL", "5"))
+
+# Kinds of item that can be priced, rules for "fine" only set the tax and service fee added to overdue fines
+PRICED_ITEMS = ("book", "plan", "fine")
+CENT = Decimal("0.01")
+
+
+# Error raised when a discount code is unknown or outside the dates it is valid for
+class InvalidDiscountCodeError(ValueError):
+    pass
+
+
+# Error raised when every copy of a book is already on loan
+class BookUnavailableError(ValueError):
+    pass
+
+
+# Class for one pricing rule or discount code, built from an entry of the rules file
+# Conditions: item, genre, book_id, plan_id, start and end dates (inclusive) and weekdays (0 is Monday)
+# Effects, applied in this order: price, percent_off, amount_off, then tax and service_fee replace the charges
+class PricingRule:
+    CONDITIONS = ("item", "genre", "book_id", "plan_id", "start", "end", "weekdays")
+    EFFECTS = ("price", "percent_off", "amount_off", "tax", "service_fee")
+
+    def __init__(self, name, spec, order):
+        unknown = set(spec) - set(self.CONDITIONS) - set(self.EFFECTS) - {"name"}
+        if unknown:
+            raise ValueError(f"Pricing rule '{name}' has unknown field(s): {', '.join(sorted(unknown))}")
+        self.name = spec.get("name", name)
+        self.spec = spec
+        self.order = order
+        self.genre = spec["genre"].casefold() if spec.get("genre") else None
+        self.book_id = int(spec["book_id"]) if spec.get("book_id") is not None else None
+        self.plan_id = int(spec["plan_id"]) if spec.get("plan_id") is not None else None
+        # A genre or book condition only applies to books and a plan condition only to plans
+        if self.plan_id is not None:
+            self.item = "plan"
+        elif self.genre is not None or self.book_id is not None:
+            self.item = "book"
+        else:
+            self.item = spec.get("item")
+        if self.item != spec.get("item", self.item):
+            raise ValueError(f"Pricing rule '{self.name}' has conditions for more than one kind of item.")
+        if self.item is not None and self.item not in PRICED_ITEMS:
+            raise ValueError(f"Pricing rule '{self.name}' has an unknown item '{self.item}'.")
+        self.start = datetime.date.fromisoformat(spec["start"]) if spec.get("start") else None
+        self.end = datetime.date.fromisoformat(spec["end"]) if spec.get("end") else None
+        self.weekdays = frozenset(int(day) for day in spec["weekdays"]) if spec.get("weekdays") else None
+        self.effects = [(field, Decimal(str(spec[field]))) for field in self.EFFECTS if spec.get(field) is not None]
+        if not self.effects:
+            raise ValueError(f"Pricing rule '{self.name}' does not change any charge.")
+
+    # Key the rule is filed under in the compiled index, the most selective condition is used
+    def keys(self):
+        if self.book_id is not None:
+            return [("book", self.book_id)]
+        if self.plan_id is not None:
+            return [("plan", self.plan_id)]
+        if self.genre is not None:
+            return [("genre", self.genre)]
+        return [(item, None) for item in ([self.item] if self.item else PRICED_ITEMS)]
+
+    def in_effect(self, on):
+        if self.start and on < self.start or self.end and on > self.end:
+            return False
+        return self.weekdays is None or on.weekday() in self.weekdays
+
+    def matches(self, item, item_id, genre, on):
+        if self.item is not None and self.item != item:
+            return False
+        if self.book_id is not None and self.book_id != item_id:
+            return False
+        if self.plan_id is not None and self.plan_id != item_id:
+            return False
+        if self.genre is not None and self.genre != genre:
+            return False
+        return self.in_effect(on)
+
+    # Apply the effects to a dict of price, tax and service_fee, a price never drops below zero
+    def apply(self, charges):
+        for field, value in self.effects:
+            if field == "percent_off":
+                charges["price"] -= charges["price"] * value / 100
+            elif field == "amount_off":
+                charges["price"] -= value
+            else:
+                charges[field] = value
+        charges["price"] = max(charges["price"], Decimal(0))
+
+    # Return (conditions, effects) as text for listing the rules
+    def describe(self):
+        conditions = ", ".join(f"{field}={self.spec[field]}" for field in self.CONDITIONS if field in self.spec)
+        return conditions or "always", ", ".join(f"{field}={value}" for field, value in self.effects)
+
+
+# Class holding the price breakdown of one item, every amount is rounded to the cent
+class PriceQuote:
+    def __init__(self, item, item_id, base_price, charges, applied):
+        self.item = item
+        self.item_id = item_id
+        self.base_price = Decimal(base_price)
+        self.price = charges["price"].quantize(CENT, ROUND_HALF_UP)
+        self.tax = charges["tax"].quantize(CENT, ROUND_HALF_UP)
+        self.service_fee = charges["service_fee"].quantize(CENT, ROUND_HALF_UP)
+        self.total = self.price + self.tax + self.service_fee
+        self.applied = applied
+
+    def as_dict(self):
+        return {"type": self.item, "id": self.item_id, "base_price": self.base_price, "price": self.price,
+                "tax": self.tax, "service_fee": self.service_fee, "total": self.total, "rules": self.applied}
+
+
+# Class for a compiled rules file: rules are filed in a dict by kind of item, genre and ID, so a quote
+# only looks at the few rules that can match instead of scanning the whole file
+class PricingRuleSet:
+    def __init__(self, spec):
+        self.tax = Decimal(str(spec.get("tax", TAX)))
+        self.service_fee = Decimal(str(spec.get("service_fee", SERVICE_FEE)))
+        self.rules = [PricingRule(f"rule {order + 1}", rule_spec, order)
+                      for order, rule_spec in enumerate(spec.get("rules", []))]
+        self.index = {}
+        for rule in self.rules:
+            for key in rule.keys():
+                self.index.setdefault(key, []).append(rule)
+        self.codes = {code.strip().upper(): PricingRule(code, code_spec, 0)
+                      for code, code_spec in spec.get("discount_codes", {}).items()}
+
+    # Rules that can match an item, in file order: the rules for its kind of item, its genre and its ID
+    def candidates(self, item, item_id, genre):
+        keys = [(item, None)] + ([("genre", genre)] if genre else []) + ([(item, item_id)] if item_id else [])
+        found = [self.index[key] for key in keys if key in self.index]
+        if len(found) == 1:
+            return found[0]
+        return sorted((rule for rules in found for rule in rules), key=lambda rule: rule.order)
+
+    # Function to price one item, the discount code is applied after the rules when its conditions match
+    # Raises InvalidDiscountCodeError when the code is unknown or not valid on the given date
+    def quote(self, item, item_id, base_price, genre=None, on=None, discount_code=None):
+        on = on or datetime.date.today()
+        genre = genre.casefold() if genre and item == "book" else None
+        charges = {"price": Decimal(base_price), "tax": self.tax, "service_fee": self.service_fee}
+        applied = []
+        for rule in self.candidates(item, item_id, genre):
+            if rule.matches(item, item_id, genre, on):
+                rule.apply(charges)
+                applied.append(rule.name)
+        if discount_code:
+            code = self.codes.get(discount_code.strip().upper())
+            if code is None or not code.in_effect(on):
+                raise InvalidDiscountCodeError(f"Discount code '{discount_code}' is not valid.")
+            if code.matches(item, item_id, genre, on):
+                code.apply(charges)
+                applied.append(code.name)
+        return PriceQuote(item, item_id, base_price, charges, applied)
+
+
+# Class keeping the compiled pricing rules in memory, the rules file is compiled once and again when it changes
+# A reload swaps in a whole new rule set, so a quote always sees one consistent version of the rules
+class PricingEngine:
+    def __init__(self, path=PRICING_RULES_FILE, check_interval=PRICING_RELOAD_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.rules = PricingRuleSet({})
+        self.mtime = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    # Compile the rules file and start using it, a missing file means the default charges only
+    # Raises ValueError for a malformed file, the rules in use are kept
+    def reload(self):
+        with self.lock:
+            mtime = self.file_mtime()
+            try:
+                spec = {}
+                if mtime is not None:
+                    with open(self.path, encoding="utf-8") as file:
+                        spec = json.load(file)
+                rules = PricingRuleSet(spec)
+            except (KeyError, TypeError, AttributeError, ArithmeticError, ValueError) as e:
+                raise ValueError(f"Invalid pricing rules in {self.path}: {e}")
+            finally:
+                self.mtime = mtime
+                self.checked_at = time.monotonic()
+            self.rules = rules
+            return rules
+
+    # Return the rules in use, at most once per check interval the file is checked and reloaded if it changed
+    def current(self):
+        if self.checked_at is None or time.monotonic() - self.checked_at >= self.check_interval:
+            if self.checked_at is None or self.file_mtime() != self.mtime:
+                try:
+                    self.reload()
+                except ValueError as e:
+                    # A bad edit is reported once and checkouts go on with the previous rules
+                    print("Error:", e)
+            else:
+                self.checked_at = time.monotonic()
+        return self.rules
+
+    def quote(self, item, item_id, base_price, genre=None, on=None, discount_code=None):
+        return self.current().quote(item, item_id, base_price, genre, on, discount_code)
+
+
+pricing = PricingEngine()
+
+# Price lookups done inside the checkout transactions, a book's genre selects the genre rules
+RENT_PRICE_QUERY = """
+SELECT Book.RentPrice, Genre.Name
+FROM Book
+LEFT JOIN Genre ON Book.GenreID = Genre.GenreID
+WHERE Book.BookID = %s
+"""
+PLAN_COST_QUERY = "SELECT Cost, NULL FROM Plan WHERE PlanID = %s"
+
+INSERT_PAYMENT_QUERY = """
+INSERT INTO Payment (UserID, Amount, PaymentDate, PaymentMethod) 
+VALUES (%s, %s, %s, %s)
+"""
+INSERT_RENTAL_CHECKOUT_QUERY = """
+INSERT INTO Checkout (UserID, BookID, Rating, ReviewDate, DueDate)
+VALUES (%s, %s, %s, %s, %s)
+"""
+INSERT_PLAN_CHECKOUT_QUERY = """
+INSERT INTO Checkout (UserID, PlanID, ReviewDate)
+VALUES (%s, %s, %s)
+"""
+
+# Takes one copy of a book, matches no row when every copy is already on loan
+RESERVE_COPY_QUERY = """
+UPDATE Book
+SET AvailableCopies = AvailableCopies - 1
+WHERE BookID = %s AND AvailableCopies > 0
+"""
+
+# Query counting a rental in the book listing, it runs in the rental's transaction
+COUNT_LISTING_RENTAL_QUERY = "UPDATE BookListing SET Rentals = Rentals + 1 WHERE BookID = %s"
+
+# Number of days a rented book may be kept
+LOAN_PERIOD_DAYS = int(os.environ.get("LIBRARY_LOAN_PERIOD_DAYS", "14"))
+
+
+# Function to look up (price, genre) with the given query, raises ValueError when the item does not exist
+def fetch_price(cursor, query, item_id, item_name):
+    cursor.execute(query, (item_id,))
+    result = cursor.fetchone()
+    if result is None:
+        raise ValueError(f"No {item_name} found with ID {item_id}.")
+    return result
+
+
+# Function to price an item looked up with the given query, the cursor may belong to a checkout transaction
+def price_item(cursor, query, item, item_id, on=None, discount_code=None):
+    price, genre = fetch_price(cursor, query, item_id, item)
+    return pricing.quote(item, item_id, price, genre, on, discount_code)
+
+
+# Function to quote renting a book, without starting a transaction, returns a PriceQuote
+def quote_rental(book_id, discount_code=None, on=None):
+    with get_cursor() as cursor:
+        return price_item(cursor, RENT_PRICE_QUERY, "book", int(book_id), on, discount_code)
+
+
+# Function to quote a plan, without starting a transaction, returns a PriceQuote
+def quote_plan(plan_id, discount_code=None, on=None):
+    with get_cursor() as cursor:
+        return price_item(cursor, PLAN_COST_QUERY, "plan", int(plan_id), on, discount_code)
+
+
+# Largest number of books priced with one query by quote_many()
+QUOTE_BATCH_SIZE = 500
+
+BOOK_PRICES_QUERY = "SELECT BookID, RentPrice, GenreName FROM BookListing WHERE BookID IN ({})"
+
+
+# Function to quote a cart of (item, ID) pairs, item is "book" or "plan", returns PriceQuotes in cart order
+# Books are priced from the listing with one query per QUOTE_BATCH_SIZE books and plans from the plan cache,
+# the whole cart uses one version of the rules and the checkout prices each item again in its transaction
+@track_operation
+def quote_many(items, discount_code=None, on=None):
+    rules = pricing.current()
+    on = on or datetime.date.today()
+    items = [(item, int(item_id)) for item, item_id in items]
+
+    books = {}
+    for batch in chunked(sorted({item_id for item, item_id in items if item == "book"}), QUOTE_BATCH_SIZE):
+        with get_cursor() as cursor:
+            cursor.execute(BOOK_PRICES_QUERY.format(", ".join(["%s"] * len(batch))), batch)
+            books.update((row[0], row[1:]) for row in cursor.fetchall())
+
+    quotes = []
+    for item, item_id in items:
+        if item == "book":
+            found = books.get(item_id)
+        elif item == "plan":
+            plan = plan_cache.get_row(item_id)
+            found = (plan[2], None) if plan else None
+        else:
+            raise ValueError(f"Cannot quote an item of type '{item}'.")
+        if found is None:
+            raise ValueError(f"No {item} found with ID {item_id}.")
+        quotes.append(rules.quote(item, item_id, found[0], found[1], on, discount_code))
+    return quotes
+
+
+# Function to rent a book once all inputs are collected
+# Price lookup, the copy reservation and both inserts run in one short transaction
+# Returns (payment_id, checkout_id, total_amount), raises BookUnavailableError when no copy is available
+@track_operation
+def process_rental(user_id, book_id, payment_method, rating="", payment_date=None, discount_code=None):
+    book_id = int(book_id)
+    payment_date = payment_date or datetime.date.today()
+    due_date = payment_date + datetime.timedelta(days=LOAN_PERIOD_DAYS)
+    with get_cursor(commit=True) as cursor:
+        quote = price_item(cursor, RENT_PRICE_QUERY, "book", book_id, payment_date, discount_code)
+        total_amount = quote.total
+
+        # The conditional update is the reservation and runs before the inserts: the foreign key check of the
+        # Checkout insert takes a shared lock on the Book row, so two rentals that both inserted first would
+        # each wait for the other's shared lock to upgrade it and deadlock. Taking the exclusive lock first
+        # makes concurrent rentals of a book queue up, and a rental that finds no copy writes nothing
+        cursor.execute(RESERVE_COPY_QUERY, (book_id,))
+        if cursor.rowcount == 0:
+            raise BookUnavailableError(f"All copies of book {book_id} are currently on loan.")
+        cursor.execute(INSERT_PAYMENT_QUERY, (user_id, total_amount, payment_date, payment_method))
+        payment_id = cursor.lastrowid
+        cursor.execute(INSERT_RENTAL_CHECKOUT_QUERY, (user_id, book_id, rating, payment_date, due_date))
+        checkout_id = cursor.lastrowid
+        cursor.execute(COUNT_LISTING_RENTAL_QUERY, (book_id,))
+    audit_log.record("rent_book", "Checkout", checkout_id, new_value={
+        "book_id": book_id, "payment_id": payment_id, "amount": total_amount, "payment_method": payment_method,
+        "due_date": due_date, "pricing_rules": quote.applied}, actor=current_actor.get() or user_id)
+    return payment_id, checkout_id, total_amount
+
+
+# Function to return a rented book and put the copy back in stock, returns False when there is no open loan
+# When user_id is given only that user's loan can be returned
+@track_operation
+def return_book(checkout_id, user_id=None, return_date=None):
+    return_date = return_date or datetime.date.today()
+    query = """
+    UPDATE Checkout
+    SET ReturnDate = %s
+    WHERE CheckoutID = %s AND BookID IS NOT NULL AND ReturnDate IS NULL
+    """
+    params = [return_date, checkout_id]
+    if user_id:
+        query += " AND UserID = %s"
+        params.append(user_id)
+
+    with get_cursor(commit=True) as cursor:
+        # Only one concurrent return can match the open loan, so the copy is restocked exactly once
+        cursor.execute(query, params)
+        if cursor.rowcount == 0:
+            return False
+        cursor.execute("""
+            UPDATE Book
+            SET AvailableCopies = AvailableCopies + 1
+            WHERE BookID = (SELECT BookID FROM Checkout WHERE CheckoutID = %s)
+        """, (checkout_id,))
+    audit_log.record("return_book", "Checkout", checkout_id, new_value={"return_date": return_date},
+                     actor=current_actor.get() or user_id)
+    return True
 
-    tax = Decimal('3.50')  # Fixed tax amount
-    service_fee = Decimal('5.00')  # Fixed service fee
-    total_amount = plan_cost + tax + service_fee
 
-    # Display checkout details
-    print(f"\n\nService fee:                                  Rs. {service_fee:.2f}")
-    print(f"Tax:                                          Rs. {tax:.2f}")
+LOANS_QUERY = """
+    SELECT Checkout.CheckoutID, Checkout.UserID, Book.BookID, Book.Title, Checkout.ReviewDate, Checkout.DueDate
+    FROM Checkout
+    JOIN Book ON Checkout.BookID = Book.BookID
+    WHERE Checkout.ReturnDate IS NULL
+"""
+LOAN_HEADERS = ["CheckoutID", "Username", "BookID", "Title", "Rented On", "Due Date"]
+
+
+# Function to list a user's open loans
+@track_operation
+def fetch_active_loans(user_id):
+    with get_cursor() as cursor:
+        cursor.execute(LOANS_QUERY + " AND Checkout.UserID = %s ORDER BY Checkout.DueDate", (user_id,))
+        return cursor.fetchall()
+
+
+# Number of overdue loans listed per page
+OVERDUE_PAGE_SIZE = 100
+
+
+# Function to list open loans that are past their due date, in CheckoutID order, after_id continues a listing
+@track_operation
+def fetch_overdue_loans(as_of=None, limit=OVERDUE_PAGE_SIZE, after_id=0):
+    as_of = as_of or datetime.date.today()
+    with get_cursor() as cursor:
+        cursor.execute(LOANS_QUERY + " AND Checkout.DueDate < %s AND Checkout.CheckoutID > %s"
+                                     " ORDER BY Checkout.CheckoutID LIMIT %s", (as_of, after_id, limit))
+        return cursor.fetchall()
+
+
+# Function to subscribe a user to a plan once all inputs are collected
+# Price lookup and both inserts run in one short transaction, returns (payment_id, checkout_id, total_amount)
+@track_operation
+def process_plan_checkout(user_id, plan_id, payment_method, payment_date=None, discount_code=None):
+    plan_id = int(plan_id)
+    payment_date = payment_date or datetime.date.today()
+    with get_cursor(commit=True) as cursor:
+        quote = price_item(cursor, PLAN_COST_QUERY, "plan", plan_id, payment_date, discount_code)
+        total_amount = quote.total
+        cursor.execute(INSERT_PAYMENT_QUERY, (user_id, total_amount, payment_date, payment_method))
+        payment_id = cursor.lastrowid
+        cursor.execute(INSERT_PLAN_CHECKOUT_QUERY, (user_id, plan_id, payment_date))
+        checkout_id = cursor.lastrowid
+    audit_log.record("checkout_plan", "Checkout", checkout_id, new_value={
+        "plan_id": plan_id, "payment_id": payment_id, "amount": total_amount, "payment_method": payment_method,
+        "pricing_rules": quote.applied}, actor=current_actor.get() or user_id)
+    return payment_id, checkout_id, total_amount
+
+
+# Function to print the price breakdown of a quote
+def print_quote(quote):
+    print(f"\n\n{'Price:':<46}Rs. {quote.base_price:.2f}")
+    if quote.price != quote.base_price:
+        print(f"{'Price after ' + ', '.join(quote.applied) + ':':<46}Rs. {quote.price:.2f}")
+    print(f"{'Service fee:':<46}Rs. {quote.service_fee:.2f}")
+    print(f"{'Tax:':<46}Rs. {quote.tax:.2f}")
     print("--------------------------------------------------------------------------")
-    print(f"Total Amount (including tax and service fee): Rs. {total_amount:.2f}")
+    print(f"Total Amount (including tax and service fee): Rs. {quote.total:.2f}")
 
-    proceed = input("\n\tProceed to payment? (yes/no): ")
 
-    if proceed.lower() == "yes":
-        # Insert payment and checkout details
-        payment_method = input("Enter payment method (gpay/phonepay/credit/debit) : ")
-        payment_date = datetime.date.today()  # Correctly calling datetime.date.today()
+# Function to ask for an optional discount code and quote an item with it, returns (discount_code, quote)
+# A code that is not valid is asked for again, leaving it blank quotes without a code
+def input_quote(quote, item_id):
+    while True:
+        discount_code = input("Enter a discount code (optional): ").strip() or None
+        try:
+            return discount_code, quote(item_id, discount_code)
+        except InvalidDiscountCodeError as e:
+            print("Error:", e)
 
-        # Insert payment record
-        insert_payment_query = """
-        INSERT INTO Payment (UserID, Amount, PaymentDate, PaymentMethod) 
-        VALUES (%s, %s, %s, %s)
-        """
-        cursor.execute(insert_payment_query, (user_id, total_amount, payment_date, payment_method))
 
-        # Insert checkout record
-        insert_checkout_query = """
-        INSERT INTO Checkout (UserID, PlanID, ReviewDate)
-        VALUES (%s, %s, %s)
-        """
-        cursor.execute(insert_checkout_query, (user_id, plan_id, payment_date))
+# Function to check out with selected plan
+def checkout_plan(plan_id, user_id):
+    try:
+        # Quote the plan before asking for payment, nothing is locked while the user decides
+        discount_code, quote = input_quote(quote_plan, plan_id)
+        print_quote(quote)
 
-        databaseobj.commit()
-        print("---->Payment successful! You are now subscribed to the plan.<----")
-    else:
-        print("---->Payment cancelled. Returning to menu.<----")
+        proceed = input("\n\tProceed to payment? (yes/no): ")
+
+        if proceed.lower() == "yes":
+            payment_method = input("Enter payment method (gpay/phonepay/credit/debit) : ")
+
+            payment_id, checkout_id, total_amount = process_plan_checkout(user_id, plan_id, payment_method,
+                                                                          discount_code=discount_code)
+            print(f"Payment ID: {payment_id}, Checkout ID: {checkout_id}, Amount paid: Rs. {total_amount:.2f}")
+            print("---->Payment successful! You are now subscribed to the plan.<----")
+        else:
+            print("---->Payment cancelled. Returning to menu.<----")
+    except Exception as e:
+        print("Error:", e)
+
+
+# Function to reload the pricing rules file and list the charges, rules and discount codes now in use
+def view_pricing_rules():
+    try:
+        rules = pricing.reload()
+        print(f"\nDefault tax: Rs. {rules.tax:.2f}, default service fee: Rs. {rules.service_fee:.2f}")
+        rows = [[rule.name, *rule.describe()] for rule in rules.rules]
+        rows += [[f"code {code}", *rule.describe()] for code, rule in rules.codes.items()]
+        if rows:
+            print(tabulate(rows, headers=["Rule", "Applies To", "Changes"], tablefmt="grid"))
+        else:
+            print(f"No pricing rules in {pricing.path}, the default charges apply to every checkout.")
+    except Exception as e:
+        print("Error:", e)
 
 
 # Function to register new admin (accessible from the admin menu only)
@@ -293,46 +1995,289 @@ def register_new_admin():
             role = "admin"
 
             # Insert validated data into the database
-            insert_query = """
-            INSERT INTO Login (Username, Password, FirstName, LastName, Email, Role) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(insert_query, (username, password, first_name, last_name, email, role))
-            databaseobj.commit()
+            register_user(username, password, first_name, last_name, email, role)
             print("-->New admin registered successfully!<--")
             break
         except Exception as e:
             print("Error:", e)
 
 
-# Function to view all books with BookID, Title, Author Name, Genre Name, and Rent Price
-def view_books():
-    query = """
-    SELECT Book.BookID, Book.Title, Author.Name AS AuthorName, Genre.Name AS GenreName, Book.RentPrice
-    FROM Book
+# Number of books fetched and shown per page while browsing the catalog
+BOOKS_PAGE_SIZE = 20
+
+# Base query for the book listing, pages are cut from it with keyset conditions on BookID
+# It reads the denormalized BookListing table, so a page is one range scan of its primary key without joins
+BOOK_LISTING_QUERY = "SELECT BookID, Title, AuthorName, GenreName, RentPrice FROM BookListing"
+
+
+# Function to fetch a single page of books using keyset pagination on BookID
+# direction "next" returns books after book_id, "prev" books before it and "jump" books from it onwards
+@track_operation
+def fetch_books_page(book_id=0, page_size=BOOKS_PAGE_SIZE, direction="next"):
+    if direction == "prev":
+        query = BOOK_LISTING_QUERY + " WHERE BookID < %s ORDER BY BookID DESC LIMIT %s"
+    elif direction == "jump":
+        query = BOOK_LISTING_QUERY + " WHERE BookID >= %s ORDER BY BookID LIMIT %s"
+    else:
+        query = BOOK_LISTING_QUERY + " WHERE BookID > %s ORDER BY BookID LIMIT %s"
+
+    with get_cursor() as cursor:
+        cursor.execute(query, (book_id, page_size))
+        page = cursor.fetchall()
+
+    if direction == "prev":
+        # Rows come back newest first, flip them so the page still reads in BookID order
+        page.reverse()
+    return page
+
+
+# Function to browse the books page by page with BookID, Title, Author Name, Genre Name, and Rent Price
+def view_books(page_size=BOOKS_PAGE_SIZE):
+    headers = ["BookID", "Title", "Author Name", "Genre", "Rent Price"]
+    try:
+        page = fetch_books_page(0, page_size)
+        if not page:
+            print("No books found.")
+            return
+
+        while True:
+            print("\nBooks:")
+            print(tabulate(page, headers=headers, tablefmt="grid"))
+            print(f"Showing BookID {page[0][0]} to {page[-1][0]} ({page_size} per page)")
+
+            action = input("[n]ext, [p]revious, [j]ump to BookID, page [s]ize, [q]uit: ").strip().lower()
+
+            if action == "n":
+                next_page = fetch_books_page(page[-1][0], page_size)
+                if next_page:
+                    page = next_page
+                else:
+                    print("You are on the last page.")
+            elif action == "p":
+                previous_page = fetch_books_page(page[0][0], page_size, "prev")
+                if previous_page:
+                    page = previous_page
+                else:
+                    print("You are on the first page.")
+            elif action == "j":
+                book_id = int(input("Enter the BookID to jump to: "))
+                jumped_page = fetch_books_page(book_id, page_size, "jump")
+                if jumped_page:
+                    page = jumped_page
+                else:
+                    print("No books found from that BookID onwards.")
+            elif action == "s":
+                new_size = int(input("Enter the number of books per page: "))
+                if new_size < 1:
+                    print("Page size must be at least 1.")
+                else:
+                    page_size = new_size
+                    page = fetch_books_page(page[0][0], page_size, "jump")
+            elif action in ("q", ""):
+                break
+            else:
+                print("Invalid choice. Please select a valid option.")
+    except Exception as e:
+        print("Error:", e)
+
+
+# Seconds before cached reference data (authors, genres, plans) is reloaded from the database
+REFERENCE_CACHE_TTL = int(os.environ.get("LIBRARY_REFERENCE_CACHE_TTL", "300"))
+
+
+# Class to keep a small, rarely changing table in memory with ID -> row and Name -> ID maps
+# The whole table is loaded on first use and again once the TTL has passed or invalidate() is called
+class ReferenceCache:
+    def __init__(self, list_query, find_query=None, insert_query=None, ttl=REFERENCE_CACHE_TTL):
+        self.list_query = list_query
+        self.find_query = find_query
+        self.insert_query = insert_query
+        self.ttl = ttl
+        self.rows = []
+        self.by_id = {}
+        self.by_name = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    # Reload the table if it has never been loaded or the TTL has expired
+    def refresh(self):
+        with self.lock:
+            if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+                return
+            with get_cursor() as cursor:
+                cursor.execute(self.list_query)
+                rows = cursor.fetchall()
+            self.rows = rows
+            self.by_id = {row[0]: row for row in rows}
+            # Name lookups only apply to tables whose second column is the name
+            self.by_name = {row[1]: row[0] for row in rows} if self.find_query else {}
+            self.loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    # Add a row written by this process so it is visible without reloading the table
+    def remember(self, row):
+        with self.lock:
+            if row[0] not in self.by_id:
+                self.rows.append(row)
+            self.by_id[row[0]] = row
+            if self.find_query:
+                self.by_name[row[1]] = row[0]
+
+    def get_rows(self):
+        self.refresh()
+        return self.rows
+
+    def get_row(self, row_id):
+        self.refresh()
+        return self.by_id.get(row_id)
+
+    # Look up an ID by name, a miss is checked against the database since another process may have added it
+    def get_id(self, name):
+        self.refresh()
+        row_id = self.by_name.get(name)
+        if row_id is None:
+            with get_cursor() as cursor:
+                cursor.execute(self.find_query, (name,))
+                result = cursor.fetchone()
+            if result:
+                row_id = result[0]
+                self.remember((row_id, name))
+        return row_id
+
+    # Look up an ID by name and insert a new row when the name is unknown, returns (id, created)
+    def get_or_create(self, name):
+        row_id = self.get_id(name)
+        if row_id is not None:
+            return row_id, False
+        with get_cursor(commit=True) as cursor:
+            cursor.execute(self.insert_query, (name,))
+            row_id = cursor.lastrowid
+        self.remember((row_id, name))
+        return row_id, True
+
+
+# Lookups used when adding a book, backed by the unique indexes on Author.Name and Genre.Name
+FIND_AUTHOR_QUERY = "SELECT AuthorID FROM Author WHERE Name = %s"
+FIND_GENRE_QUERY = "SELECT GenreID FROM Genre WHERE Name = %s"
+
+author_cache = ReferenceCache("SELECT AuthorID, Name FROM Author ORDER BY AuthorID", FIND_AUTHOR_QUERY,
+                              "INSERT INTO Author (Name) VALUES (%s)")
+genre_cache = ReferenceCache("SELECT GenreID, Name FROM Genre ORDER BY GenreID", FIND_GENRE_QUERY,
+                             "INSERT INTO Genre (Name) VALUES (%s)")
+plan_cache = ReferenceCache("SELECT PlanID, Duration, Cost, Details FROM Plan ORDER BY PlanID")
+
+
+# Ranked book search, matches on titles and author names are found through their own full-text
+# index and summed per book, filters are appended to the WHERE clause by search_books()
+SEARCH_BOOKS_QUERY = """
+    SELECT Book.BookID, Book.Title, Author.Name AS AuthorName, Genre.Name AS GenreName, Book.RentPrice,
+           Ranked.Score
+    FROM (
+        SELECT Hits.BookID, SUM(Hits.Score) AS Score
+        FROM (
+            SELECT BookID, MATCH(Title) AGAINST (%s IN NATURAL LANGUAGE MODE) AS Score
+            FROM Book
+            WHERE MATCH(Title) AGAINST (%s IN NATURAL LANGUAGE MODE)
+            UNION ALL
+            SELECT Book.BookID, MATCH(Author.Name) AGAINST (%s IN NATURAL LANGUAGE MODE) AS Score
+            FROM Author
+            JOIN Book ON Book.AuthorID = Author.AuthorID
+            WHERE MATCH(Author.Name) AGAINST (%s IN NATURAL LANGUAGE MODE)
+        ) AS Hits
+        GROUP BY Hits.BookID
+    ) AS Ranked
+    JOIN Book ON Book.BookID = Ranked.BookID
     JOIN Author ON Book.AuthorID = Author.AuthorID
     JOIN Genre ON Book.GenreID = Genre.GenreID
-    """
+    WHERE 1 = 1
+"""
+
+# The same search for SQLite, which has no MATCH ... AGAINST, titles and author names containing the
+# search terms score one point each
+SQLITE_SEARCH_BOOKS_QUERY = SEARCH_BOOKS_QUERY.replace(
+    "MATCH(Title) AGAINST (%s IN NATURAL LANGUAGE MODE)", "(instr(lower(Title), lower(%s)) > 0)").replace(
+    "MATCH(Author.Name) AGAINST (%s IN NATURAL LANGUAGE MODE)", "(instr(lower(Author.Name), lower(%s)) > 0)")
+
+SEARCH_BOOKS_QUERIES = {"mysql": SEARCH_BOOKS_QUERY, "sqlite": SQLITE_SEARCH_BOOKS_QUERY}
+
+
+# Function to search books by title or author name with optional genre and rent price filters
+# Returns one page of (BookID, Title, AuthorName, GenreName, RentPrice, Score) rows, best matches first
+@track_operation
+def search_books(terms, genre_name=None, min_price=None, max_price=None, page=1, page_size=BOOKS_PAGE_SIZE):
+    query = SEARCH_BOOKS_QUERIES[storage.name]
+    params = [terms, terms, terms, terms]
+
+    if genre_name:
+        query += " AND Genre.Name = %s"
+        params.append(genre_name)
+    if min_price is not None:
+        query += " AND Book.RentPrice >= %s"
+        params.append(Decimal(min_price))
+    if max_price is not None:
+        query += " AND Book.RentPrice <= %s"
+        params.append(Decimal(max_price))
+
+    query += " ORDER BY Ranked.Score DESC, Book.BookID LIMIT %s OFFSET %s"
+    params += [page_size, (page - 1) * page_size]
+
+    with get_cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+# Function to search the catalog and page through the ranked results
+def search_catalog(page_size=BOOKS_PAGE_SIZE):
+    headers = ["BookID", "Title", "Author Name", "Genre", "Rent Price"]
     try:
-        cursor.execute(query)
-        result = cursor.fetchall()
+        terms = input("Enter title or author keywords: ").strip()
+        if not terms:
+            print("Please enter at least one keyword.")
+            return
+        genre_name = input("Filter by genre (leave blank for all): ").strip() or None
+        min_price = input("Minimum rent price (leave blank for none): ").strip() or None
+        max_price = input("Maximum rent price (leave blank for none): ").strip() or None
+
+        page = 1
+        results = search_books(terms, genre_name, min_price, max_price, page, page_size)
+        if not results:
+            print("No books matched your search.")
+            return
 
-        if result:
-            headers = ["BookID", "Title", "Author Name", "Genre", "Rent Price"]
-            print("\nBooks:")
-            print(tabulate(result, headers=headers, tablefmt="grid"))
-        else:
-            print("No books found.")
+        while True:
+            print(f"\nSearch results (page {page}):")
+            print(tabulate([row[:5] for row in results], headers=headers, tablefmt="grid"))
+
+            action = input("[n]ext, [p]revious, [q]uit: ").strip().lower()
+
+            if action == "n":
+                next_results = search_books(terms, genre_name, min_price, max_price, page + 1, page_size)
+                if next_results:
+                    page += 1
+                    results = next_results
+                else:
+                    print("You are on the last page.")
+            elif action == "p":
+                if page > 1:
+                    page -= 1
+                    results = search_books(terms, genre_name, min_price, max_price, page, page_size)
+                else:
+                    print("You are on the first page.")
+            elif action in ("q", ""):
+                break
+            else:
+                print("Invalid choice. Please select a valid option.")
     except Exception as e:
         print("Error:", e)
 
 
 # Function to view all authors
 def view_authors():
-    query = "SELECT AuthorID, Name FROM Author"
     try:
-        cursor.execute(query)
-        result = cursor.fetchall()
+        result = author_cache.get_rows()
 
         if result:
             headers = ["AuthorID", "Name"]
@@ -346,10 +2291,8 @@ def view_authors():
 
 # Function to view all genres
 def view_genres():
-    query = "SELECT * FROM Genre"
     try:
-        cursor.execute(query)
-        result = cursor.fetchall()
+        result = genre_cache.get_rows()
 
         if result:
             headers = ["GenreID", "Name"]
@@ -361,56 +2304,397 @@ def view_genres():
         print("Error:", e)
 
 
+INSERT_BOOK_QUERY = """
+INSERT INTO Book (Title, AuthorID, GenreID, RentPrice, Copies, AvailableCopies) 
+VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+# Query adding the listing of new books, the caller appends the WHERE condition choosing the books
+# INSERT IGNORE leaves books that are already listed alone
+INSERT_BOOK_LISTING_QUERY = """
+INSERT IGNORE INTO BookListing (BookID, Title, AuthorName, GenreName, RentPrice)
+SELECT Book.BookID, Book.Title, Author.Name, Genre.Name, Book.RentPrice
+FROM Book
+JOIN Author ON Book.AuthorID = Author.AuthorID
+JOIN Genre ON Book.GenreID = Genre.GenreID
+"""
+
+
+# Function to rebuild the whole book listing from the normalized tables, for data written outside this module
+# Readers keep seeing the old listing until the new one is committed
+@track_operation
+def rebuild_book_listing():
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("DELETE FROM BookListing")
+        cursor.execute(REBUILD_BOOK_LISTING_QUERY)
+        return cursor.rowcount
+
+
+# Function to insert a book, the author and genre may be given by ID or by name (names are created if missing)
+# Returns the new BookID
+@track_operation
+def create_book(title, author, genre, rent_price, copies=1):
+    if int(copies) < 1:
+        raise ValueError("A book needs at least one copy.")
+    author_id = author if isinstance(author, int) else author_cache.get_or_create(author)[0]
+    genre_id = genre if isinstance(genre, int) else genre_cache.get_or_create(genre)[0]
+
+    with get_cursor(commit=True) as cursor:
+        cursor.execute(INSERT_BOOK_QUERY, (title, author_id, genre_id, Decimal(rent_price), int(copies), int(copies)))
+        book_id = cursor.lastrowid
+        cursor.execute(INSERT_BOOK_LISTING_QUERY + " WHERE Book.BookID = %s", (book_id,))
+    audit_log.record("add_book", "Book", book_id, new_value={
+        "title": title, "author_id": author_id, "genre_id": genre_id, "rent_price": rent_price, "copies": copies})
+    return book_id
+
+
+# Function to change how many copies of a book the library owns, copies on loan stay on loan
+# Returns False when the book does not exist or more copies than the new total are on loan
+@track_operation
+def set_book_copies(book_id, copies):
+    copies = int(copies)
+    # AvailableCopies is assigned first, so it still sees the old Copies value
+    query = """
+    UPDATE Book
+    SET AvailableCopies = AvailableCopies + (%s - Copies), Copies = %s
+    WHERE BookID = %s AND AvailableCopies + (%s - Copies) >= 0
+    """
+    with get_cursor(commit=True) as cursor:
+        cursor.execute(query, (copies, copies, book_id, copies))
+        if cursor.rowcount == 0:
+            return False
+    audit_log.record("set_book_copies", "Book", book_id, new_value={"copies": copies})
+    return True
+
+
+# Function to change a book's title and rent price, returns False when no book has that BookID
+@track_operation
+def edit_book(book_id, title, rent_price):
+    update_query = """
+    UPDATE Book 
+    SET Title = %s, RentPrice = %s 
+    WHERE BookID = %s
+    """
+    with get_cursor(commit=True) as cursor:
+        # The old values are read under the row lock the update takes anyway, for the audit log
+        cursor.execute("SELECT Title, RentPrice FROM Book WHERE BookID = %s FOR UPDATE", (book_id,))
+        old = cursor.fetchone()
+        if old is None:
+            return False
+        cursor.execute(update_query, (title, Decimal(rent_price), book_id))
+        cursor.execute("UPDATE BookListing SET Title = %s, RentPrice = %s WHERE BookID = %s",
+                       (title, Decimal(rent_price), book_id))
+    audit_log.record("update_book", "Book", book_id, old_value={"title": old[0], "rent_price": old[1]},
+                     new_value={"title": title, "rent_price": rent_price})
+    return True
+
+
+# Function to delete a book, returns False when no book has that BookID
+@track_operation
+def remove_book(book_id):
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("SELECT Title, AuthorID, GenreID, RentPrice, Copies FROM Book WHERE BookID = %s FOR UPDATE",
+                       (book_id,))
+        old = cursor.fetchone()
+        if old is None:
+            return False
+        cursor.execute("DELETE FROM Book WHERE BookID = %s", (book_id,))
+        cursor.execute("DELETE FROM BookListing WHERE BookID = %s", (book_id,))
+    audit_log.record("delete_book", "Book", book_id, old_value=dict(zip(
+        ["title", "author_id", "genre_id", "rent_price", "copies"], old)))
+    return True
+
+
 # Function to add a new book with author and genre names instead of IDs
 def add_book():
     try:
         title = input("Enter book title: ")
 
         # Handle Author if not present in the database new author will be added
-        while True:
-            author_name = input("Enter author name: ")
-            cursor.execute("SELECT AuthorID FROM Author WHERE Name = %s", (author_name,))
-            result = cursor.fetchone()
-
-            if result:
-                author_id = result[0]
-                break
-            else:
-                print("Author not found. Adding new author.")
-                cursor.execute("INSERT INTO Author (Name) VALUES (%s)", (author_name,))
-                databaseobj.commit()
-                cursor.execute("SELECT AuthorID FROM Author WHERE Name = %s", (author_name,))
-                author_id = cursor.fetchone()[0]
-                print(f"New author added with AuthorID: {author_id}")
-                break
+        author_name = input("Enter author name: ")
+        author_id, created = author_cache.get_or_create(author_name)
+        if created:
+            print(f"Author not found. New author added with AuthorID: {author_id}")
 
         # Handle Genre if not present in the database new genre will be added
-        while True:
-            genre_name = input("Enter genre name: ")
-            cursor.execute("SELECT GenreID FROM Genre WHERE Name = %s", (genre_name,))
-            result = cursor.fetchone()
+        genre_name = input("Enter genre name: ")
+        genre_id, created = genre_cache.get_or_create(genre_name)
+        if created:
+            print(f"Genre not found. New genre added with GenreID: {genre_id}")
 
-            if result:
-                genre_id = result[0]
-                break
-            else:
-                print("Genre not found. Adding new genre.")
-                cursor.execute("INSERT INTO Genre (Name) VALUES (%s)", (genre_name,))
-                databaseobj.commit()
-                cursor.execute("SELECT GenreID FROM Genre WHERE Name = %s", (genre_name,))
-                genre_id = cursor.fetchone()[0]
-                print(f"New genre added with GenreID: {genre_id}")
-                break
         # Handle rent price in decimal
         rent_price = Decimal(input("Enter rent price: "))
+        copies = input("Enter number of copies (default 1): ").strip()
 
-        insert_query = """
-        INSERT INTO Book (Title, AuthorID, GenreID, RentPrice) 
-        VALUES (%s, %s, %s, %s)
-        """
-        cursor.execute(insert_query, (title, author_id, genre_id, rent_price))
-        databaseobj.commit()
-        print("---->Book added successfully!<----")
+        book_id = create_book(title, author_id, genre_id, rent_price, int(copies) if copies else 1)
+        print(f"---->Book added successfully with BookID: {book_id}<----")
+    except Exception as e:
+        print("Error:", e)
+
+
+# Number of rows written per transaction by the bulk importers
+IMPORT_CHUNK_SIZE = 1000
+
+
+# Function to read records one at a time from a CSV file (with a header row) or a JSON Lines file
+def read_records(path):
+    if path.lower().endswith((".jsonl", ".json")):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, newline="", encoding="utf-8") as file:
+            yield from csv.DictReader(file)
+
+
+# Function to group an iterable into lists of at most size items
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Function to resolve a batch of author or genre names to IDs, inserting the unknown names in one statement
+# Returns the IDs keyed by the requested names, a name the database could not resolve is left out
+def resolve_names(cursor, cache, table, id_column, names):
+    cache.refresh()
+    ids = {}
+    missing = []
+    for name in names:
+        row_id = cache.by_name.get(name)
+        if row_id is None:
+            missing.append(name)
+        else:
+            ids[name] = row_id
+
+    new_rows = []
+    if missing:
+        # INSERT IGNORE skips names that already exist thanks to the unique index on Name
+        cursor.executemany(f"INSERT IGNORE INTO {table} (Name) VALUES (%s)", [(name,) for name in missing])
+        placeholders = ", ".join(["%s"] * len(missing))
+        cursor.execute(f"SELECT {id_column}, Name FROM {table} WHERE Name IN ({placeholders})", missing)
+        found = {}
+        for row_id, name in cursor.fetchall():
+            found[name] = row_id
+            new_rows.append((row_id, name))
+        for name in missing:
+            row_id = found.get(name)
+            if row_id is None:
+                # The name is stored in a form the collation treats as equal, with another case or accent,
+                # only the database knows which row that is
+                cursor.execute(cache.find_query, (name,))
+                row = cursor.fetchone()
+                row_id = row[0] if row else None
+            if row_id is not None:
+                ids[name] = row_id
+    return ids, new_rows
+
+
+# Function to bulk import books from a CSV or JSON Lines file with Title, Author, Genre and RentPrice fields
+# and an optional Copies field, each chunk is written in one transaction
+# Returns the number of imported and skipped rows
+@track_operation
+def import_books(path, chunk_size=IMPORT_CHUNK_SIZE):
+    imported = 0
+    skipped = 0
+    started = time.perf_counter()
+
+    for chunk in chunked(read_records(path), chunk_size):
+        books = []
+        for record in chunk:
+            try:
+                title = record["Title"].strip()
+                author_name = record["Author"].strip()
+                genre_name = record["Genre"].strip()
+                rent_price = Decimal(str(record["RentPrice"]))
+                copies = int(record.get("Copies") or 1)
+            except Exception:
+                skipped += 1
+                continue
+            if not title or not author_name or not genre_name or copies < 1:
+                skipped += 1
+                continue
+            books.append((title, author_name, genre_name, rent_price, copies))
+
+        if not books:
+            continue
+
+        with get_cursor(commit=True) as cursor:
+            # The chunk's books get BookIDs above the current highest one
+            cursor.execute("SELECT COALESCE(MAX(BookID), 0) FROM Book")
+            last_book_id = cursor.fetchone()[0]
+            author_ids, new_authors = resolve_names(cursor, author_cache, "Author", "AuthorID",
+                                                    {book[1] for book in books})
+            genre_ids, new_genres = resolve_names(cursor, genre_cache, "Genre", "GenreID",
+                                                  {book[2] for book in books})
+            rows = [(title, author_ids[author_name], genre_ids[genre_name], rent_price, copies, copies)
+                    for title, author_name, genre_name, rent_price, copies in books
+                    if author_name in author_ids and genre_name in genre_ids]
+            cursor.executemany(INSERT_BOOK_QUERY, rows)
+            cursor.execute(INSERT_BOOK_LISTING_QUERY + " WHERE Book.BookID > %s", (last_book_id,))
+
+        # Only cache the new names once the chunk has been committed
+        for row in new_authors:
+            author_cache.remember(row)
+        for row in new_genres:
+            genre_cache.remember(row)
+
+        audit_log.record("import_books", "Book", f">{last_book_id}", new_value={"path": path, "books": len(rows)})
+        imported += len(rows)
+        skipped += len(books) - len(rows)
+        elapsed = time.perf_counter() - started
+        print(f"Imported {imported} books ({imported / elapsed:.0f} rows/second)")
+
+    elapsed = time.perf_counter() - started
+    rate = imported / elapsed if elapsed else 0
+    print(f"---->Import finished: {imported} books imported, {skipped} rows skipped "
+          f"in {elapsed:.1f}s ({rate:.0f} rows/second)<----")
+    return imported, skipped
+
+
+# Fields written by the user export, the same names are read back by the user import
+USER_EXPORT_FIELDS = ["Username", "FirstName", "LastName", "Email", "Role"]
+
+
+# Function to write rejected import rows to a CSV side file, the file is only created once a row is rejected
+# Passwords are never written to it
+class RejectsFile:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.writer = None
+        self.count = 0
+
+    def write(self, row_number, username, errors):
+        if self.file is None:
+            self.file = open(self.path, "w", newline="", encoding="utf-8")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(["Row", "Username", "Errors"])
+        self.writer.writerow([row_number, username, " ".join(message for field, message in errors)])
+        self.count += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+# Function to find which of a batch of usernames already have a login, in one query
+# Keys are casefolded because the Username column uses a case-insensitive collation
+def existing_usernames(cursor, usernames):
+    if not usernames:
+        return set()
+    placeholders = ", ".join(["%s"] * len(usernames))
+    cursor.execute(f"SELECT Username FROM Login WHERE Username IN ({placeholders})", list(usernames))
+    return {row[0].casefold() for row in cursor.fetchall()}
+
+
+# Function to return the records whose username is not registered yet, the others are written to rejects
+def unregistered(cursor, records, rejects):
+    registered = existing_usernames(cursor, [record["Username"] for record in records])
+    users = []
+    for record in records:
+        if record["Username"].casefold() in registered:
+            rejects.write(record["Row"], record["Username"], [("Username", "Username is already registered.")])
+        else:
+            users.append(record)
+    return users
+
+
+# Function to bulk import logins from a CSV or JSON Lines file with Username, Password, FirstName, LastName and
+# Email fields and an optional Role field (customer by default), records are validated as they are read
+# Passwords already in the pbkdf2_sha256 format (for example from export_users) are stored as they are, the
+# others are hashed with hash_iterations rounds, a lower cost is upgraded by authenticate() at the first login
+# Rejected rows (invalid, duplicated in the file or already registered) are listed in rejects_path
+# Returns the number of imported and rejected rows
+@track_operation
+def import_users(path, chunk_size=IMPORT_CHUNK_SIZE, rejects_path=None, hash_iterations=None):
+    imported = 0
+    started = time.perf_counter()
+    rejects = RejectsFile(rejects_path or path + ".rejects.csv")
+    # Usernames seen earlier in the file, so duplicates across chunks are rejected too
+    seen = set()
+
+    def numbered(records):
+        for row_number, record in enumerate(records, start=1):
+            record["Role"] = record.get("Role") or "customer"
+            record["Row"] = row_number
+            yield record
+
+    try:
+        for chunk in chunked(validate_records(numbered(read_records(path))), chunk_size):
+            candidates = []
+            for record, errors in chunk:
+                password = record.get("Password")
+                if is_password_hash(password):
+                    errors = [error for error in errors if error[0] != "Password"]
+                elif isinstance(password, str) and password.startswith(PASSWORD_HASH_ALGORITHM + "$"):
+                    # A value in the hash format that does not decode would lock the user out, not be their password
+                    errors = [error for error in errors if error[0] != "Password"]
+                    errors.append(("Password", "Password hash is malformed."))
+                if errors:
+                    rejects.write(record["Row"], record.get("Username"), errors)
+                elif record["Username"].casefold() in seen:
+                    rejects.write(record["Row"], record["Username"],
+                                  [("Username", "Username appears more than once in the file.")])
+                else:
+                    seen.add(record["Username"].casefold())
+                    candidates.append(record)
+
+            if not candidates:
+                continue
+
+            with get_cursor() as cursor:
+                users = unregistered(cursor, candidates, rejects)
+            if not users:
+                continue
+
+            # Hashing a chunk takes far longer than inserting it, so it runs before the transaction starts and
+            # no pooled connection or SQLite write lock is held meanwhile
+            plaintext = [record for record in users if not is_password_hash(record["Password"])]
+            for record, hashed in zip(plaintext, hash_passwords([record["Password"] for record in plaintext],
+                                                                hash_iterations)):
+                record["Password"] = hashed
+
+            with get_cursor(commit=True) as cursor:
+                # Checked again in the transaction for usernames registered while the chunk was hashed
+                users = unregistered(cursor, users, rejects)
+                if not users:
+                    continue
+                cursor.executemany(INSERT_LOGIN_QUERY, [
+                    (record["Username"], record["Password"], record["FirstName"], record["LastName"],
+                     record["Email"], record["Role"])
+                    for record in users
+                ])
+
+            imported += len(users)
+            elapsed = time.perf_counter() - started
+            print(f"Imported {imported} users, rejected {rejects.count} rows ({imported / elapsed:.0f} rows/second)")
+    finally:
+        rejects.close()
+
+    elapsed = time.perf_counter() - started
+    rate = imported / elapsed if elapsed else 0
+    print(f"---->Import finished: {imported} users imported, {rejects.count} rows rejected "
+          f"in {elapsed:.1f}s ({rate:.0f} rows/second)<----")
+    if rejects.count:
+        print(f"Rejected rows are listed in {rejects.path}")
+    return imported, rejects.count
+
+
+# Function to bulk import books from a file chosen by the admin
+def bulk_import_books():
+    path = input("Enter the path of the CSV or JSON Lines file: ").strip()
+    chunk_size = input(f"Enter the number of books per batch (default {IMPORT_CHUNK_SIZE}): ").strip()
+
+    try:
+        import_books(path, int(chunk_size) if chunk_size else IMPORT_CHUNK_SIZE)
     except Exception as e:
         print("Error:", e)
 
@@ -421,9 +2705,10 @@ def delete_book():
     book_id = input("Enter the BookID of the book you want to delete: ")
 
     try:
-        cursor.execute("DELETE FROM Book WHERE BookID = %s", (book_id,))
-        databaseobj.commit()
-        print("Book deleted successfully!")
+        if remove_book(book_id):
+            print("Book deleted successfully!")
+        else:
+            print("No book found with that BookID.")
     except Exception as e:
         print("Error:", e)
 
@@ -437,25 +2722,18 @@ def update_book():
     rent_price = input("Enter the new rent price of the book: ")
 
     try:
-        rent_price = Decimal(rent_price)
-        update_query = """
-        UPDATE Book 
-        SET Title = %s, RentPrice = %s 
-        WHERE BookID = %s
-        """
-        cursor.execute(update_query, (title, rent_price, book_id))
-        databaseobj.commit()
-        print("Book updated successfully!")
+        if edit_book(book_id, title, rent_price):
+            print("Book updated successfully!")
+        else:
+            print("No book found with that BookID.")
     except Exception as e:
         print("Error:", e)
 
 
 # Function to view all plans
 def view_plans():
-    query = "SELECT * FROM Plan"
     try:
-        cursor.execute(query)
-        result = cursor.fetchall()
+        result = plan_cache.get_rows()
 
         if result:
             headers = ["PlanID", "Duration", "Cost", "Details"]
@@ -468,15 +2746,27 @@ def view_plans():
 
 
 # Function to display customer menu
-def customer_menu():
+def customer_menu(session):
+    current_actor.set(session.username)
     while True:
+        try:
+            require_session(session, "customer")
+        except NotAuthorizedError as e:
+            print(e)
+            break
+
         print("\n\t\t-------------------------------------------"
               "\n\t\t\t\t ----CUSTOMER MENU----\n\t\t-------------------------------------------\n")
         print("\t[1]. View Books")
         print("\t[2]. View Authors")
         print("\t[3]. View Genre")
         print("\t[4]. Rent Book")
-        print("\t[5]. Logout")
+        print("\t[5]. Search Books")
+        print("\t[6]. My Loans")
+        print("\t[7]. Return Book")
+        print("\t[8]. Recommended Books")
+        print("\t[9]. Popular In Genre")
+        print("\t[10]. Logout")
 
         choice = input("\n\t\tEnter your choice: ")
 
@@ -487,8 +2777,18 @@ def customer_menu():
         elif choice == "3":
             view_genres()
         elif choice == "4":
-            rent_book()
+            rent_book(session)
         elif choice == "5":
+            search_catalog()
+        elif choice == "6":
+            view_my_loans(session)
+        elif choice == "7":
+            return_rented_book(session)
+        elif choice == "8":
+            view_recommendations(session)
+        elif choice == "9":
+            view_popular_in_genre()
+        elif choice == "10":
             print("Logging out...")
             break
         else:
@@ -496,45 +2796,24 @@ def customer_menu():
 
 
 # Function to handle book rental
-def rent_book():
+def rent_book(session):
     view_books()  # Show the list of books to help the customer choose which one to rent
     book_id = input("Enter the BookID of the book you want to rent: ")
-    username = input("Enter your username: ")  # Assuming the user is logged in
 
     try:
-        cursor.execute("SELECT RentPrice FROM Book WHERE BookID = %s", (book_id,))
-        rent_price = cursor.fetchone()[0]
-
-        # Convert rent_price to Decimal for accurate monetary calculations
-        rent_price = Decimal(rent_price)
-
-        tax = Decimal('3.50')  # Fixed tax amount
-        service_fee = Decimal('5.00')  # Fixed service fee
-        total_amount = rent_price + tax + service_fee
-
-        print(f"Total Amount (including tax and service fee): Rs. {total_amount:.2f}")
+        username = require_session(session, "customer").username
+        discount_code, quote = input_quote(quote_rental, book_id)
+        print_quote(quote)
         proceed = input("Proceed to payment? (yes/no): ")
 
         if proceed.lower() == "yes":
+            # Collect every input before the transaction starts
             payment_method = input("Enter payment method: ")
-            payment_date = datetime.date.today()
-
-            # Insert payment record
-            insert_payment_query = """
-            INSERT INTO Payment (UserID, Amount, PaymentDate, PaymentMethod) 
-            VALUES (%s, %s, %s, %s)
-            """
-            cursor.execute(insert_payment_query, (username, total_amount, payment_date, payment_method))
-
-            # Insert checkout record
-            insert_checkout_query = """
-            INSERT INTO Checkout (UserID, BookID, Rating, ReviewDate)
-            VALUES (%s, %s, %s, %s)
-            """
             rating = input("Enter your rating (optional): ")
-            cursor.execute(insert_checkout_query, (username, book_id, rating, payment_date))
 
-            databaseobj.commit()
+            payment_id, checkout_id, total_amount = process_rental(username, book_id, payment_method, rating,
+                                                                   discount_code=discount_code)
+            print(f"Payment ID: {payment_id}, Checkout ID: {checkout_id}, Amount paid: Rs. {total_amount:.2f}")
             print("Payment successful! Enjoy your book.")
         else:
             print("Payment cancelled. Returning to menu.")
@@ -542,62 +2821,955 @@ def rent_book():
         print("Error:", e)
 
 
-def view_payments():
-    query = "SELECT PaymentID, UserID, Amount, PaymentDate, PaymentMethod FROM Payment"
+# Number of rows fetched from the server and rendered or exported at a time by the streaming listings
+STREAM_CHUNK_SIZE = 500
+
+
+# Function to stream the result of a query in chunks of at most chunk_size rows
+# The cursor is unbuffered, so rows stay on the server until fetched and only one chunk is in memory
+def stream_query(query, params=(), chunk_size=STREAM_CHUNK_SIZE):
+    with get_cursor() as cursor:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+# Function to print chunks of rows as separate grids, returns the number of rows printed
+def print_chunks(title, headers, chunks, empty_message):
+    total = 0
+    for rows in chunks:
+        if total == 0:
+            print(f"\n{title}:")
+        print(tabulate(rows, headers=headers, tablefmt="grid"))
+        total += len(rows)
+
+    if total:
+        print(f"{total} row(s) listed.")
+    else:
+        print(empty_message)
+    return total
+
+
+# Rows fetched and written per batch by the exports, a Parquet file gets one row group per batch
+EXPORT_BATCH_SIZE = int(os.environ.get("LIBRARY_EXPORT_BATCH_SIZE", "10000"))
+
+
+# Function to return the Arrow type of a kind of exported column
+def arrow_type(kind):
+    return {
+        "int": pyarrow.int64(),
+        "text": pyarrow.string(),
+        "money": pyarrow.decimal128(14, 2),
+        "date": pyarrow.date32(),
+    }[kind]
+
+
+# Class writing batches of rows to a CSV file with a header row
+class CsvExportWriter:
+    def __init__(self, path, headers, kinds):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(headers)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+# Class writing batches of rows to a Parquet file or an Arrow IPC file, columns are typed from their kinds
+class ArrowExportWriter:
+    def __init__(self, path, headers, kinds):
+        if pyarrow is None:
+            raise RuntimeError("Parquet and Arrow exports need the pyarrow package, export to a .csv file instead.")
+        self.schema = pyarrow.schema([(header, arrow_type(kind)) for header, kind in zip(headers, kinds)])
+        if path.lower().endswith(".parquet"):
+            self.sink = None
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            self.sink = pyarrow.OSFile(path, "wb")
+            self.writer = pyarrow.ipc.new_file(self.sink, self.schema)
+
+    def write(self, rows):
+        columns = zip(*rows)
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema)
+        self.writer.write_table(pyarrow.Table.from_batches([batch]))
+
+    def close(self):
+        self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+
+
+# Function to write chunks of rows to a file as they arrive, the format follows the extension:
+# .parquet, .arrow or .feather for the columnar formats and CSV otherwise
+# kinds gives the type of each column ("int", "text", "money" or "date") for the columnar formats
+# Returns the number of rows written
+def export_chunks(path, headers, chunks, kinds=None):
+    columnar = path.lower().endswith((".parquet", ".arrow", ".feather"))
+    writer = (ArrowExportWriter if columnar else CsvExportWriter)(path, headers, kinds or ["text"] * len(headers))
+    total = 0
+    started = time.perf_counter()
+    try:
+        for rows in chunks:
+            writer.write(rows)
+            total += len(rows)
+            print(f"Exported {total} rows ({total / (time.perf_counter() - started):.0f} rows/second)")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"---->{total} row(s) exported to {path} in {elapsed:.1f}s<----")
+    return total
+
+
+# Function to export logins to a CSV or JSON Lines file, rows are streamed from the server one chunk at a time
+# With include_passwords the stored hashes are exported too, so the file can be imported into another library
+# Returns the number of exported rows
+@track_operation
+def export_users(path, include_passwords=False, chunk_size=STREAM_CHUNK_SIZE):
+    fields = USER_EXPORT_FIELDS + (["Password"] if include_passwords else [])
+    query = f"SELECT {', '.join(fields)} FROM Login ORDER BY Username"
+    exported = 0
+    started = time.perf_counter()
+
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        as_json = path.lower().endswith((".jsonl", ".json"))
+        writer = csv.writer(file)
+        if not as_json:
+            writer.writerow(fields)
+        for rows in stream_query(query, chunk_size=chunk_size):
+            if as_json:
+                file.writelines(json.dumps(dict(zip(fields, row))) + "\n" for row in rows)
+            else:
+                writer.writerows(rows)
+            exported += len(rows)
+            elapsed = time.perf_counter() - started
+            print(f"Exported {exported} users ({exported / elapsed:.0f} rows/second)")
+
+    elapsed = time.perf_counter() - started
+    print(f"---->{exported} user(s) exported to {path} in {elapsed:.1f}s<----")
+    return exported
+
+
+# Function to read an optional date filter, blank input means no filter
+def input_date(prompt):
+    value = input(prompt).strip()
+    return datetime.date.fromisoformat(value) if value else None
+
+
+PAYMENTS_QUERY = "SELECT PaymentID, UserID, Amount, PaymentDate, PaymentMethod FROM Payment WHERE 1 = 1"
+PAYMENT_HEADERS = ["Payment ID", "Customer ID", "Amount", "Date", "Payment Method"]
+PAYMENT_KINDS = ["int", "text", "money", "date", "text"]
+
+
+# Function to stream payments in chunks, the date range and user filters are applied by MySQL
+# after_id continues a listing after the last PaymentID already seen
+def stream_payments(start_date=None, end_date=None, user_id=None, chunk_size=STREAM_CHUNK_SIZE, after_id=0):
+    query = PAYMENTS_QUERY
+    params = []
+    if after_id:
+        query += " AND PaymentID > %s"
+        params.append(after_id)
+    if user_id:
+        query += " AND UserID = %s"
+        params.append(user_id)
+    if start_date:
+        query += " AND PaymentDate >= %s"
+        params.append(start_date)
+    if end_date:
+        query += " AND PaymentDate <= %s"
+        params.append(end_date)
+    query += " ORDER BY PaymentID"
+    return stream_query(query, params, chunk_size)
+
+
+# Function to show the open loans of a customer
+def view_my_loans(session):
+    try:
+        loans = fetch_active_loans(require_session(session, "customer").username)
+        if loans:
+            print("\nYour Loans:")
+            print(tabulate(loans, headers=LOAN_HEADERS, tablefmt="grid"))
+        else:
+            print("You have no books on loan.")
+    except Exception as e:
+        print("Error:", e)
+
+
+# Function to return a rented book
+def return_rented_book(session):
+    checkout_id = input("Enter the CheckoutID of the loan you want to return: ")
     try:
-        cursor.execute(query)
-        payments = cursor.fetchall()
-
-        if payments:
-            headers = ["Payment ID", "Customer ID", "Amount", "Date", "Payment Method"]
-            table = []
-            for payment in payments:
-                payment_id = payment[0]
-                customer_id = payment[1]
-                amount = payment[2]
-                date = payment[3]
-                payment_method = payment[4]
-                table.append([payment_id, customer_id, amount, date, payment_method])
-
-            print("\nPayments:")
-            print(tabulate(table, headers=headers, tablefmt="grid"))
+        if return_book(int(checkout_id), require_session(session, "customer").username):
+            print("Book returned successfully! Thank you.")
         else:
-            print("No payments available.")
+            print("No open loan found with that CheckoutID.")
     except Exception as e:
         print("Error:", e)
 
 
+# Function to page through the loans that are past their due date
+def view_overdue_loans():
+    try:
+        loans = fetch_overdue_loans()
+        if not loans:
+            print("No overdue loans.")
+            return
+
+        while loans:
+            print("\nOverdue Loans:")
+            print(tabulate(loans, headers=LOAN_HEADERS, tablefmt="grid"))
+            if len(loans) < OVERDUE_PAGE_SIZE or input("Show more? (yes/no): ").strip().lower() != "yes":
+                break
+            loans = fetch_overdue_loans(after_id=loans[-1][0])
+    except Exception as e:
+        print("Error:", e)
+
+
+# Function to change the number of copies of a book
+def update_book_copies():
+    book_id = input("Enter the BookID of the book: ")
+    copies = input("Enter the total number of copies the library owns: ")
+    try:
+        if set_book_copies(int(book_id), int(copies)):
+            print("Copies updated successfully!")
+        else:
+            print("No book found with that BookID, or more copies are on loan than the new total.")
+    except Exception as e:
+        print("Error:", e)
+
+
+# Fine charged per day a loan is overdue, tax and service fee are added on top as for a rental
+FINE_PER_DAY = Decimal(os.environ.get("LIBRARY_FINE_PER_DAY", "10.00"))
+FINE_PAYMENT_METHOD = "overdue fine"
+
+# Number of overdue loans fined per transaction by the sweep
+FINE_SWEEP_CHUNK_SIZE = 1000
+
+# Conditions selecting the loans of one UserID range that still need a fine for the sweep day,
+# FinedThrough makes the sweep idempotent, a loan fined for a day is never charged for it again
+OVERDUE_FINE_CONDITIONS = """
+    ReturnDate IS NULL AND BookID IS NOT NULL AND DueDate < %(as_of)s
+    AND (FinedThrough IS NULL OR FinedThrough < %(as_of)s)
+    AND UserID >= %(lower)s AND (%(upper)s IS NULL OR UserID < %(upper)s)
+"""
+
+# Charges one chunk of overdue loans: days since the last fine (or the due date) times FINE_PER_DAY, plus the
+# tax and service fee the pricing rules give a "fine" on the sweep day, added to the first fine of a loan only,
+# so what a loan is charged in total does not depend on how often the sweep runs
+INSERT_FINES_QUERY = """
+    INSERT INTO Payment (UserID, Amount, PaymentDate, PaymentMethod)
+    SELECT UserID, DATEDIFF(%(as_of)s, COALESCE(FinedThrough, DueDate)) * %(fine_per_day)s
+                   + CASE WHEN FinedThrough IS NULL THEN %(tax)s + %(fee)s ELSE 0 END,
+           %(as_of)s, %(method)s
+    FROM Checkout
+    WHERE CheckoutID > %(after_id)s AND CheckoutID <= %(last_id)s AND
+""" + OVERDUE_FINE_CONDITIONS
+
+
+# Function to split the users into contiguous Username ranges of about the same size, one per worker
+# Returns (lower, upper) pairs, lower is inclusive, upper is exclusive and None means no upper bound
+def user_ranges(partitions):
+    with get_cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM Login")
+        total = cursor.fetchone()[0]
+        bounds = []
+        for index in range(1, partitions):
+            cursor.execute("SELECT Username FROM Login ORDER BY Username LIMIT 1 OFFSET %s",
+                           (index * total // partitions,))
+            row = cursor.fetchone()
+            if row and (not bounds or row[0] > bounds[-1]):
+                bounds.append(row[0])
+
+    lowers = [""] + bounds
+    uppers = bounds + [None]
+    return list(zip(lowers, uppers))
+
+
+# Function to fine the overdue loans of one UserID range in keyset-paged chunks, one transaction per chunk
+# Progress is stored per chunk, so an interrupted sweep resumes after the last committed chunk
+# Returns the number of loans fined
+@track_operation
+def sweep_fines_partition(as_of, lower="", upper=None, chunk_size=FINE_SWEEP_CHUNK_SIZE):
+    partition_key = f"{lower}..{upper or ''}"
+    # Fines are priced in SQL, the pricing rules for "fine" on the sweep date set the tax and service fee
+    charges = pricing.quote("fine", None, 0, on=as_of)
+    params = {"as_of": as_of, "lower": lower, "upper": upper, "fine_per_day": FINE_PER_DAY, "tax": charges.tax,
+              "fee": charges.service_fee, "method": FINE_PAYMENT_METHOD}
+
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("INSERT IGNORE INTO FineSweepProgress (SweepDate, PartitionKey) VALUES (%s, %s)",
+                       (as_of, partition_key))
+        cursor.execute("SELECT LastCheckoutID, Completed FROM FineSweepProgress "
+                       "WHERE SweepDate = %s AND PartitionKey = %s", (as_of, partition_key))
+        after_id, completed = cursor.fetchone()
+    if completed:
+        return 0
+
+    fined = 0
+    while True:
+        with get_cursor(commit=True) as cursor:
+            params["after_id"] = after_id
+            params["limit"] = chunk_size
+            # Upper CheckoutID of the next chunk, found on the primary key without reading the rows
+            cursor.execute("""
+                SELECT MAX(CheckoutID) FROM (
+                    SELECT CheckoutID FROM Checkout
+                    WHERE CheckoutID > %(after_id)s AND """ + OVERDUE_FINE_CONDITIONS + """
+                    ORDER BY CheckoutID
+                    LIMIT %(limit)s
+                ) AS Chunk
+            """, params)
+            last_id = cursor.fetchone()[0]
+
+            if last_id is None:
+                cursor.execute("UPDATE FineSweepProgress SET Completed = TRUE "
+                               "WHERE SweepDate = %s AND PartitionKey = %s", (as_of, partition_key))
+                break
+
+            params["last_id"] = last_id
+            cursor.execute(INSERT_FINES_QUERY, params)
+            fined += cursor.rowcount
+            cursor.execute("UPDATE Checkout SET FinedThrough = %(as_of)s "
+                           "WHERE CheckoutID > %(after_id)s AND CheckoutID <= %(last_id)s AND "
+                           + OVERDUE_FINE_CONDITIONS, params)
+            cursor.execute("UPDATE FineSweepProgress SET LastCheckoutID = %s "
+                           "WHERE SweepDate = %s AND PartitionKey = %s", (last_id, as_of, partition_key))
+        after_id = last_id
+    return fined
+
+
+# Function run in each worker process of the sweep
+def sweep_fines_worker(as_of, lower, upper, chunk_size):
+    # A forked worker must not reuse the parent's connections
+    storage.reset()
+    return sweep_fines_partition(as_of, lower, upper, chunk_size)
+
+
+# Function to fine every overdue loan as of a day, the users are split into one UserID range per worker process
+# Returns the number of loans fined
+def run_fine_sweep(as_of=None, workers=1, chunk_size=FINE_SWEEP_CHUNK_SIZE):
+    as_of = as_of or datetime.date.today()
+    started = time.perf_counter()
+    ranges = user_ranges(workers)
+
+    if workers > 1:
+        with multiprocessing.Pool(len(ranges)) as pool:
+            fined = sum(pool.starmap(sweep_fines_worker,
+                                     [(as_of, lower, upper, chunk_size) for lower, upper in ranges]))
+    else:
+        fined = sum(sweep_fines_partition(as_of, lower, upper, chunk_size) for lower, upper in ranges)
+
+    audit_log.record("sweep_fines", "Payment", as_of, new_value={"loans_fined": fined, "partitions": len(ranges)})
+    elapsed = time.perf_counter() - started
+    print(f"---->Fine sweep for {as_of}: {fined} overdue loan(s) fined in {elapsed:.1f}s "
+          f"across {len(ranges)} partition(s)<----")
+    return fined
+
+
+# Function to run the fine sweep from the admin menu
+def run_fine_sweep_menu():
+    try:
+        as_of = input_date("Fine loans overdue as of YYYY-MM-DD (leave blank for today): ")
+        workers = input("Number of worker processes (default 1): ").strip()
+        run_fine_sweep(as_of, int(workers) if workers else 1)
+    except Exception as e:
+        print("Error:", e)
+
+
+# Function to show the payments, or export them when a path is given
+@track_operation
+def list_payments(user_id=None, start_date=None, end_date=None, path=None):
+    if path:
+        export_chunks(path, PAYMENT_HEADERS, stream_payments(start_date, end_date, user_id, EXPORT_BATCH_SIZE),
+                      PAYMENT_KINDS)
+    else:
+        print_chunks("Payments", PAYMENT_HEADERS, stream_payments(start_date, end_date, user_id),
+                     "No payments available.")
+
+
+def view_payments():
+    try:
+        user_id = input("Filter by customer ID (leave blank for all): ").strip() or None
+        start_date = input_date("From date YYYY-MM-DD (leave blank for none): ")
+        end_date = input_date("To date YYYY-MM-DD (leave blank for none): ")
+        path = input("Export to a CSV, Parquet or Arrow file (leave blank to show on screen): ").strip()
+        list_payments(user_id, start_date, end_date, path)
+    except Exception as e:
+        print("Error:", e)
+
+
+CUSTOMER_DETAILS_QUERY = """
+    SELECT Username, Email, FirstName, LastName
+    FROM Login
+    WHERE Role = 'customer'
+"""
+CUSTOMER_HEADERS = ["Username", "Email", "First Name", "Last Name"]
+CUSTOMER_KINDS = ["text", "text", "text", "text"]
+
+
+# Function to stream customer details in chunks, optionally only usernames starting with a prefix
+def stream_customers(username_prefix=None, chunk_size=STREAM_CHUNK_SIZE):
+    query = CUSTOMER_DETAILS_QUERY
+    params = []
+    if username_prefix:
+        query += " AND Username LIKE %s"
+        params.append(username_prefix.replace("%", "\\%").replace("_", "\\_") + "%")
+    query += " ORDER BY Username"
+    return stream_query(query, params, chunk_size)
+
+
+# Function to show the customer details, or export them when a path is given
+@track_operation
+def list_customers(username_prefix=None, path=None):
+    if path:
+        export_chunks(path, CUSTOMER_HEADERS, stream_customers(username_prefix, EXPORT_BATCH_SIZE), CUSTOMER_KINDS)
+    else:
+        print_chunks("Customer Details", CUSTOMER_HEADERS, stream_customers(username_prefix),
+                     "No customer details available.")
+
+
 def view_customer_details():
-    query = """
-    SELECT username, email, firstname, lastname
-    FROM login
-    WHERE role = 'customer'
-    """
     try:
-        cursor.execute(query)
-        customers = cursor.fetchall()
-
-        if customers:
-            headers = ["Username", "Email", "First Name", "Last Name"]
-            table = []
-            for customer in customers:
-                username = customer[0]
-                email = customer[1]
-                first_name = customer[2]
-                last_name = customer[3]
-                table.append([username, email, first_name, last_name])
-
-            print("\nCustomer Details:")
-            print(tabulate(table, headers=headers, tablefmt="grid"))
+        username_prefix = input("Filter by username prefix (leave blank for all): ").strip() or None
+        path = input("Export to a CSV, Parquet or Arrow file (leave blank to show on screen): ").strip()
+        list_customers(username_prefix, path)
+    except Exception as e:
+        print("Error:", e)
+
+
+BOOK_HEADERS = ["BookID", "Title", "Author Name", "Genre", "Rent Price"]
+BOOK_KINDS = ["int", "text", "text", "text", "money"]
+
+
+# Function to stream the whole book listing in BookID order
+def stream_books(chunk_size=STREAM_CHUNK_SIZE):
+    return stream_query(BOOK_LISTING_QUERY + " ORDER BY BookID", (), chunk_size)
+
+
+# Listings that can be exported in full, each entry is (headers, column kinds, function streaming the rows)
+EXPORTS = {
+    "books": (BOOK_HEADERS, BOOK_KINDS, stream_books),
+    "payments": (PAYMENT_HEADERS, PAYMENT_KINDS, lambda chunk_size: stream_payments(chunk_size=chunk_size)),
+    "customers": (CUSTOMER_HEADERS, CUSTOMER_KINDS, lambda chunk_size: stream_customers(chunk_size=chunk_size)),
+}
+
+
+# Function to export a whole listing to a CSV, Parquet or Arrow file in batches of batch_size rows
+# Returns the number of rows exported
+@track_operation
+def export_listing(name, path, batch_size=EXPORT_BATCH_SIZE):
+    headers, kinds, stream = EXPORTS[name]
+    return export_chunks(path, headers, stream(batch_size), kinds)
+
+
+# Function to export a listing chosen by the admin
+def export_listing_menu():
+    try:
+        name = input(f"Listing to export ({', '.join(EXPORTS)}): ").strip().lower()
+        if name not in EXPORTS:
+            print("Unknown listing.")
+            return
+        path = input("Export to file (.csv, .parquet or .arrow): ").strip()
+        if path:
+            export_listing(name, path)
         else:
-            print("No customer details available.")
+            print("Please enter a file name.")
     except Exception as e:
         print("Error:", e)
 
 
+# Queries checked by the index advisor, each entry is (name, query, sample parameters)
+INDEX_ADVISOR_QUERIES = [
+    ("view_books page", BOOK_LISTING_QUERY + " WHERE BookID > %s ORDER BY BookID LIMIT %s",
+     (0, BOOKS_PAGE_SIZE)),
+    ("search_books", SEARCH_BOOKS_QUERIES[storage.name] + " ORDER BY Ranked.Score DESC, Book.BookID LIMIT %s OFFSET %s",
+     ("sample", "sample", "sample", "sample", BOOKS_PAGE_SIZE, 0)),
+    ("add_book author lookup", FIND_AUTHOR_QUERY, ("",)),
+    ("add_book genre lookup", FIND_GENRE_QUERY, ("",)),
+    ("login", LOGIN_QUERY, ("",)),
+    ("rent_book price", RENT_PRICE_QUERY, (0,)),
+    ("checkout_plan cost", PLAN_COST_QUERY, (0,)),
+    ("view_customer_details", CUSTOMER_DETAILS_QUERY, ()),
+    ("payments by user", PAYMENTS_QUERY + " AND UserID = %s ORDER BY PaymentID", ("",)),
+    ("payments by date", PAYMENTS_QUERY + " AND PaymentDate >= %s AND PaymentDate <= %s ORDER BY PaymentID",
+     (datetime.date.today(), datetime.date.today())),
+    ("checkouts by user and book", "SELECT CheckoutID FROM Checkout WHERE UserID = %s AND BookID = %s", ("", 0)),
+]
+
+
+# Function to explain the application's queries and flag the ones that scan a whole table
+@track_operation
+def explain_queries():
+    report = []
+    full_scans = []
+    try:
+        with get_cursor() as cursor:
+            for name, query, params in INDEX_ADVISOR_QUERIES:
+                for table, access_type, index, rows, full_scan in storage.explain(cursor, query, params):
+                    status = "FULL SCAN" if full_scan else "ok"
+                    report.append([name, table, access_type, index, rows, status])
+                    if full_scan:
+                        full_scans.append((name, table))
+
+        headers = ["Query", "Table", "Access Type", "Index Used", "Rows Examined", "Status"]
+        print("\nQuery Plans:")
+        print(tabulate(report, headers=headers, tablefmt="grid"))
+        if full_scans:
+            print(f"{len(full_scans)} table access(es) fall back to a full table scan.")
+        else:
+            print("All queries are served by an index.")
+    except Exception as e:
+        print("Error:", e)
+    return full_scans
+
+
+# Number of recommendations stored per book and shown to a customer
+RECOMMENDATIONS_PER_BOOK = int(os.environ.get("LIBRARY_RECOMMENDATIONS_PER_BOOK", "10"))
+
+# Distinct (UserID, BookID) pairs of every rental, in UserID order so each reader's books arrive together
+RENTAL_PAIRS_QUERY = "SELECT DISTINCT UserID, BookID FROM Checkout WHERE BookID IS NOT NULL ORDER BY UserID"
+
+
+# Function to number the readers and books of the rental pairs, returns (reader rows, book columns, book IDs)
+def read_rental_pairs():
+    readers = {}
+    books = {}
+    rows = []
+    columns = []
+    for chunk in stream_query(RENTAL_PAIRS_QUERY):
+        for user_id, book_id in chunk:
+            rows.append(readers.setdefault(user_id, len(readers)))
+            columns.append(books.setdefault(book_id, len(books)))
+    return rows, columns, list(books)
+
+
+# Function to score pairs of books rented by the same readers with numpy and scipy
+# The reader x book matrix times its transpose counts the readers of every pair of books at once
+def score_pairs_sparse(rows, columns, book_ids, top_n):
+    ratings = sparse.csr_matrix((numpy.ones(len(rows)), (rows, columns)),
+                                shape=(max(rows) + 1, len(book_ids)))
+    together = (ratings.T @ ratings).tocsr()
+    readers = together.diagonal()
+    together.setdiag(0)
+    together.eliminate_zeros()
+
+    for book in range(len(book_ids)):
+        start, end = together.indptr[book], together.indptr[book + 1]
+        if start == end:
+            continue
+        others = together.indices[start:end]
+        # Cosine similarity, so books everybody rents do not top every list
+        scores = together.data[start:end] / numpy.sqrt(readers[book] * readers[others])
+        best = numpy.argsort(-scores, kind="stable")[:top_n]
+        yield book_ids[book], [(book_ids[others[i]], float(scores[i])) for i in best]
+
+
+# Function to score pairs of books rented by the same readers in pure Python, same result as score_pairs_sparse()
+def score_pairs_python(rows, columns, book_ids, top_n):
+    books_by_reader = {}
+    for row, column in zip(rows, columns):
+        books_by_reader.setdefault(row, []).append(column)
+
+    readers = [0] * len(book_ids)
+    together = [dict() for _ in book_ids]
+    for books in books_by_reader.values():
+        for book in books:
+            readers[book] += 1
+            counts = together[book]
+            for other in books:
+                if other != book:
+                    counts[other] = counts.get(other, 0) + 1
+
+    for book, counts in enumerate(together):
+        if not counts:
+            continue
+        scores = [(other, count / (readers[book] * readers[other]) ** 0.5) for other, count in counts.items()]
+        scores.sort(key=lambda item: -item[1])
+        yield book_ids[book], [(book_ids[other], score) for other, score in scores[:top_n]]
+
+
+# Function to rebuild the BookRecommendation table from the whole rental history, meant to run as a batch job
+# Readers keep seeing the previous recommendations until the new ones are committed
+# Returns the number of books given recommendations
+@track_operation
+def build_recommendations(top_n=RECOMMENDATIONS_PER_BOOK):
+    started = time.perf_counter()
+    rows, columns, book_ids = read_rental_pairs()
+    score_pairs = score_pairs_sparse if numpy is not None else score_pairs_python
+
+    # The books are scored before the transaction starts, so the write locks are only held while the rows are replaced
+    recommendations = []
+    if rows:
+        recommendations = [(book_id, position, other_id, Decimal(f"{score:.6f}"))
+                           for book_id, ranked in score_pairs(rows, columns, book_ids, top_n)
+                           for position, (other_id, score) in enumerate(ranked, start=1)]
+    books = sum(1 for row in recommendations if row[1] == 1)
+
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("DELETE FROM BookRecommendation")
+        for chunk in chunked(recommendations, IMPORT_CHUNK_SIZE):
+            cursor.executemany("INSERT INTO BookRecommendation (BookID, Position, RecommendedBookID, Score) "
+                               "VALUES (%s, %s, %s, %s)", chunk)
+
+    print(f"---->Recommendations built for {books} books from {len(rows)} rentals "
+          f"in {time.perf_counter() - started:.1f}s<----")
+    return books
+
+
+# Book columns shown with recommendations, read from the book listing
+RECOMMENDATION_COLUMNS = "BookListing.BookID, BookListing.Title, BookListing.AuthorName, BookListing.GenreName, " \
+                         "BookListing.RentPrice"
+
+ALSO_RENTED_QUERY = f"""
+    SELECT {RECOMMENDATION_COLUMNS}
+    FROM BookRecommendation
+    JOIN BookListing ON BookListing.BookID = BookRecommendation.RecommendedBookID
+    WHERE BookRecommendation.BookID = %s
+    ORDER BY BookRecommendation.Position
+    LIMIT %s
+"""
+
+# Recommendations of the books a customer rented are added up, books they already rented are left out
+CUSTOMER_RECOMMENDATIONS_QUERY = f"""
+    SELECT {RECOMMENDATION_COLUMNS}
+    FROM (
+        SELECT RecommendedBookID, SUM(Score) AS Score
+        FROM BookRecommendation
+        WHERE BookID IN (SELECT BookID FROM Checkout WHERE UserID = %s AND BookID IS NOT NULL)
+        AND RecommendedBookID NOT IN (SELECT BookID FROM Checkout WHERE UserID = %s AND BookID IS NOT NULL)
+        GROUP BY RecommendedBookID
+    ) AS Ranked
+    JOIN BookListing ON BookListing.BookID = Ranked.RecommendedBookID
+    ORDER BY Ranked.Score DESC, BookListing.BookID
+    LIMIT %s
+"""
+
+POPULAR_BOOKS_QUERY = "SELECT BookID, Title, AuthorName, GenreName, RentPrice FROM BookListing"
+
+
+# Function to return the books most often rented by readers of a book
+@track_operation
+def fetch_also_rented(book_id, limit=RECOMMENDATIONS_PER_BOOK):
+    with get_cursor() as cursor:
+        cursor.execute(ALSO_RENTED_QUERY, (book_id, limit))
+        return cursor.fetchall()
+
+
+# Function to return the most rented books, overall or within one genre
+@track_operation
+def fetch_popular_books(genre_name=None, limit=RECOMMENDATIONS_PER_BOOK):
+    with get_cursor() as cursor:
+        if genre_name:
+            cursor.execute(POPULAR_BOOKS_QUERY + " WHERE GenreName = %s ORDER BY Rentals DESC LIMIT %s",
+                           (genre_name, limit))
+        else:
+            cursor.execute(POPULAR_BOOKS_QUERY + " ORDER BY Rentals DESC LIMIT %s", (limit,))
+        return cursor.fetchall()
+
+
+# Function to return recommendations for a customer, customers with no rentals yet get the most rented books
+@track_operation
+def fetch_recommendations(user_id, limit=RECOMMENDATIONS_PER_BOOK):
+    with get_cursor() as cursor:
+        cursor.execute(CUSTOMER_RECOMMENDATIONS_QUERY, (user_id, user_id, limit))
+        books = cursor.fetchall()
+    return books or fetch_popular_books(limit=limit)
+
+
+# Function to show the logged in customer's recommendations
+def view_recommendations(session):
+    headers = ["BookID", "Title", "Author Name", "Genre", "Rent Price"]
+    try:
+        books = fetch_recommendations(require_session(session, "customer").username)
+        if not books:
+            print("No recommendations yet.")
+            return
+        print("\nRecommended for you:")
+        print(tabulate(books, headers=headers, tablefmt="grid"))
+
+        book_id = input("Enter a BookID to see what its readers also rented (leave blank to go back): ").strip()
+        if book_id:
+            also_rented = fetch_also_rented(int(book_id))
+            if also_rented:
+                print("\nReaders of this book also rented:")
+                print(tabulate(also_rented, headers=headers, tablefmt="grid"))
+            else:
+                print("No other rentals recorded for readers of this book.")
+    except Exception as e:
+        print("Error:", e)
+
+
+# Function to show the most rented books of a genre
+def view_popular_in_genre():
+    headers = ["BookID", "Title", "Author Name", "Genre", "Rent Price"]
+    try:
+        view_genres()
+        genre_name = input("Enter the genre name (leave blank for all genres): ").strip() or None
+        books = fetch_popular_books(genre_name)
+        if books:
+            print(f"\nPopular in {genre_name or 'all genres'}:")
+            print(tabulate(books, headers=headers, tablefmt="grid"))
+        else:
+            print("No books found in that genre.")
+    except Exception as e:
+        print("Error:", e)
+
+
+# Function to rebuild the recommendations from the admin menu
+def build_recommendations_menu():
+    try:
+        build_recommendations()
+    except Exception as e:
+        print("Error:", e)
+
+
+# Incremental refresh of the report summary tables, each entry is (watermark name, source table, id column,
+# aggregate query), the aggregate query folds rows with an ID in (last watermark, new watermark] into the summary
+REPORT_SUMMARIES = [
+    ("revenue", "Payment", "PaymentID", """
+        INSERT INTO DailyRevenue (PaymentDate, PaymentMethod, Revenue, Payments)
+        SELECT PaymentDate, COALESCE(PaymentMethod, ''), SUM(Amount), COUNT(*)
+        FROM Payment
+        WHERE PaymentID > %s AND PaymentID <= %s
+        GROUP BY PaymentDate, COALESCE(PaymentMethod, '')
+        ON DUPLICATE KEY UPDATE Revenue = Revenue + VALUES(Revenue), Payments = Payments + VALUES(Payments)
+    """),
+    ("rentals", "Checkout", "CheckoutID", """
+        INSERT INTO DailyBookRentals (RentalDate, BookID, Rentals)
+        SELECT ReviewDate, BookID, COUNT(*)
+        FROM Checkout
+        WHERE CheckoutID > %s AND CheckoutID <= %s AND BookID IS NOT NULL
+        GROUP BY ReviewDate, BookID
+        ON DUPLICATE KEY UPDATE Rentals = Rentals + VALUES(Rentals)
+    """),
+]
+
+
+# Seconds a gap in the IDs of a summarized table may belong to a transaction that has not committed yet,
+# after that the missing ID is taken to be a rolled back or deleted row, it must exceed any transaction's length
+REPORT_SETTLE_SECONDS = int(os.environ.get("LIBRARY_REPORT_SETTLE_SECONDS", "60"))
+
+
+# Function to return the last ID of the unbroken run of IDs right after after_id, or after_id when the next is missing
+def contiguous_end(cursor, table, id_column, after_id):
+    cursor.execute(f"SELECT 1 FROM {table} WHERE {id_column} = %s", (after_id + 1,))
+    if cursor.fetchone() is None:
+        return after_id
+    cursor.execute(f"""
+        SELECT MIN(Run.{id_column})
+        FROM {table} Run
+        WHERE Run.{id_column} > %s
+          AND NOT EXISTS (SELECT 1 FROM {table} Next WHERE Next.{id_column} = Run.{id_column} + 1)
+    """, (after_id,))
+    return cursor.fetchone()[0]
+
+
+# Function to fold the payments and checkouts committed since the last refresh into the summary tables
+# Returns the number of new source rows seen per summary
+@track_operation
+def refresh_report_summaries():
+    refreshed = {}
+    for name, table, id_column, aggregate_query in REPORT_SUMMARIES:
+        with get_cursor(commit=True) as cursor:
+            # Locking the watermark row keeps concurrent refreshes from counting the same rows twice
+            cursor.execute("SELECT LastID, PendingID, PendingAt FROM ReportWatermark WHERE ReportName = %s FOR UPDATE",
+                           (name,))
+            last_id, pending_id, pending_at = cursor.fetchone()
+            now = datetime.datetime.now()
+
+            # IDs are handed out at insert time, so a transaction still open leaves a gap that rows committed
+            # after it can be past. Rows are folded up to the first gap, and the gaps seen at one refresh are
+            # only stepped over once every ID taken by then has had REPORT_SETTLE_SECONDS to commit or roll back
+            folded_id = last_id
+            if pending_id > last_id and now - pending_at >= datetime.timedelta(seconds=REPORT_SETTLE_SECONDS):
+                folded_id = pending_id
+            folded_id = contiguous_end(cursor, table, id_column, folded_id)
+            if folded_id > last_id:
+                cursor.execute(aggregate_query, (last_id, folded_id))
+
+            cursor.execute(f"SELECT MAX({id_column}) FROM {table}")
+            max_id = cursor.fetchone()[0] or 0
+            if max_id > folded_id and pending_id <= folded_id:
+                pending_id, pending_at = max_id, now
+            cursor.execute("UPDATE ReportWatermark SET LastID = %s, PendingID = %s, PendingAt = %s "
+                           "WHERE ReportName = %s", (folded_id, pending_id, pending_at, name))
+            refreshed[name] = folded_id - last_id
+    return refreshed
+
+
+# Reports, each entry is (title, headers, query over the raw tables, query over the summary tables)
+# Every query takes a start date, an end date and a row limit
+REPORTS = {
+    "daily": ("Daily Revenue", ["Date", "Revenue", "Payments"], """
+        SELECT PaymentDate, SUM(Amount), COUNT(*)
+        FROM Payment
+        WHERE PaymentDate BETWEEN %s AND %s
+        GROUP BY PaymentDate
+        ORDER BY PaymentDate
+        LIMIT %s
+    """, """
+        SELECT PaymentDate, SUM(Revenue), SUM(Payments)
+        FROM DailyRevenue
+        WHERE PaymentDate BETWEEN %s AND %s
+        GROUP BY PaymentDate
+        ORDER BY PaymentDate
+        LIMIT %s
+    """),
+    "monthly": ("Monthly Revenue", ["Year", "Month", "Revenue", "Payments"], """
+        SELECT YEAR(PaymentDate), MONTH(PaymentDate), SUM(Amount), COUNT(*)
+        FROM Payment
+        WHERE PaymentDate BETWEEN %s AND %s
+        GROUP BY YEAR(PaymentDate), MONTH(PaymentDate)
+        ORDER BY 1, 2
+        LIMIT %s
+    """, """
+        SELECT YEAR(PaymentDate), MONTH(PaymentDate), SUM(Revenue), SUM(Payments)
+        FROM DailyRevenue
+        WHERE PaymentDate BETWEEN %s AND %s
+        GROUP BY YEAR(PaymentDate), MONTH(PaymentDate)
+        ORDER BY 1, 2
+        LIMIT %s
+    """),
+    "method": ("Revenue by Payment Method", ["Payment Method", "Revenue", "Payments"], """
+        SELECT COALESCE(PaymentMethod, ''), SUM(Amount), COUNT(*)
+        FROM Payment
+        WHERE PaymentDate BETWEEN %s AND %s
+        GROUP BY COALESCE(PaymentMethod, '')
+        ORDER BY 2 DESC
+        LIMIT %s
+    """, """
+        SELECT PaymentMethod, SUM(Revenue), SUM(Payments)
+        FROM DailyRevenue
+        WHERE PaymentDate BETWEEN %s AND %s
+        GROUP BY PaymentMethod
+        ORDER BY 2 DESC
+        LIMIT %s
+    """),
+    "books": ("Top Rented Books", ["BookID", "Title", "Rentals"], """
+        SELECT Book.BookID, Book.Title, COUNT(*)
+        FROM Checkout
+        JOIN Book ON Checkout.BookID = Book.BookID
+        WHERE Checkout.ReviewDate BETWEEN %s AND %s
+        GROUP BY Book.BookID, Book.Title
+        ORDER BY 3 DESC
+        LIMIT %s
+    """, """
+        SELECT Book.BookID, Book.Title, Totals.Rentals
+        FROM (
+            SELECT BookID, SUM(Rentals) AS Rentals
+            FROM DailyBookRentals
+            WHERE RentalDate BETWEEN %s AND %s
+            GROUP BY BookID
+            ORDER BY Rentals DESC
+            LIMIT %s
+        ) AS Totals
+        JOIN Book ON Totals.BookID = Book.BookID
+        ORDER BY Totals.Rentals DESC
+    """),
+    "genres": ("Top Genres", ["Genre", "Rentals"], """
+        SELECT Genre.Name, COUNT(*)
+        FROM Checkout
+        JOIN Book ON Checkout.BookID = Book.BookID
+        JOIN Genre ON Book.GenreID = Genre.GenreID
+        WHERE Checkout.ReviewDate BETWEEN %s AND %s
+        GROUP BY Genre.GenreID, Genre.Name
+        ORDER BY 2 DESC
+        LIMIT %s
+    """, """
+        SELECT Genre.Name, SUM(DailyBookRentals.Rentals)
+        FROM DailyBookRentals
+        JOIN Book ON DailyBookRentals.BookID = Book.BookID
+        JOIN Genre ON Book.GenreID = Genre.GenreID
+        WHERE DailyBookRentals.RentalDate BETWEEN %s AND %s
+        GROUP BY Genre.GenreID, Genre.Name
+        ORDER BY 2 DESC
+        LIMIT %s
+    """),
+}
+
+# Default number of rows shown by a report
+REPORT_LIMIT = 100
+
+
+# Function to run a report, returns (title, headers, rows)
+# With use_summary the summary tables are refreshed first and the report reads from them instead of the raw tables
+@track_operation
+def run_report(name, start_date=None, end_date=None, limit=REPORT_LIMIT, use_summary=True):
+    title, headers, live_query, summary_query = REPORTS[name]
+    start_date = start_date or datetime.date(1000, 1, 1)
+    end_date = end_date or datetime.date(9999, 12, 31)
+
+    if use_summary:
+        refresh_report_summaries()
+    with get_cursor() as cursor:
+        cursor.execute(summary_query if use_summary else live_query, (start_date, end_date, limit))
+        return title, headers, cursor.fetchall()
+
+
+# Function to show a report chosen from the reports menu
+def show_report(name):
+    try:
+        start_date = input_date("From date YYYY-MM-DD (leave blank for none): ")
+        end_date = input_date("To date YYYY-MM-DD (leave blank for none): ")
+
+        title, headers, rows = run_report(name, start_date, end_date)
+        if rows:
+            print(f"\n{title}:")
+            print(tabulate(rows, headers=headers, tablefmt="grid"))
+        else:
+            print("No data for the selected period.")
+    except Exception as e:
+        print("Error:", e)
+
+
+# Function to handle reports menu
+def reports_menu():
+    while True:
+        print("\n\t\t-------------------------------------------"
+              "\n\t\t\t       ----REPORTS----\n\t\t-------------------------------------------\n")
+        print("\t[1]. Daily Revenue")
+        print("\t[2]. Monthly Revenue")
+        print("\t[3]. Revenue by Payment Method")
+        print("\t[4]. Top Rented Books")
+        print("\t[5]. Top Genres")
+        print("\t[6]. Back")
+
+        choice = input("\n\t\tEnter your choice: ")
+
+        if choice == '1':
+            show_report("daily")
+        elif choice == '2':
+            show_report("monthly")
+        elif choice == '3':
+            show_report("method")
+        elif choice == '4':
+            show_report("books")
+        elif choice == '5':
+            show_report("genres")
+        elif choice == '6':
+            break
+        else:
+            print("Invalid choice. Please try again.")
+
+
 # Function to handle admin menu
-def admin_menu():
+def admin_menu(session):
+    current_actor.set(session.username)
     while True:
+        try:
+            require_session(session, "admin")
+        except NotAuthorizedError as e:
+            print(e)
+            break
+
         print("\n\t\t-------------------------------------------"
               "\n\t\t\t       ----ADMIN MENU----\n\t\t-------------------------------------------\n")
         print("\t[1]. Add Book")
@@ -609,7 +3781,18 @@ def admin_menu():
         print("\t[7]. View Plans")
         print("\t[8]. Register New Admin")
         print("\t[9]. View Payments")
-        print("\t[10]. Logout")
+        print("\t[10]. Check Query Indexes")
+        print("\t[11]. Bulk Import Books")
+        print("\t[12]. Search Books")
+        print("\t[13]. Reports")
+        print("\t[14]. Query Statistics")
+        print("\t[15]. Overdue Loans")
+        print("\t[16]. Set Book Copies")
+        print("\t[17]. Run Fine Sweep")
+        print("\t[18]. Build Recommendations")
+        print("\t[19]. Export Listing")
+        print("\t[20]. Pricing Rules")
+        print("\t[21]. Logout")
 
         choice = input("\n\t\tEnter your choice: ")
 
@@ -632,6 +3815,28 @@ def admin_menu():
         elif choice == '9':
             view_payments()
         elif choice == '10':
+            explain_queries()
+        elif choice == '11':
+            bulk_import_books()
+        elif choice == '12':
+            search_catalog()
+        elif choice == '13':
+            reports_menu()
+        elif choice == '14':
+            view_query_stats()
+        elif choice == '15':
+            view_overdue_loans()
+        elif choice == '16':
+            update_book_copies()
+        elif choice == '17':
+            run_fine_sweep_menu()
+        elif choice == '18':
+            build_recommendations_menu()
+        elif choice == '19':
+            export_listing_menu()
+        elif choice == '20':
+            view_pricing_rules()
+        elif choice == '21':
             print("Logging out...")
             break
         else:
@@ -640,6 +3845,8 @@ def admin_menu():
 
 # Main function to start the application
 def main():
+    configure_query_log()
+    migrate_schema()
     while True:
         print("\n\t\t-------------------------------------------"
               "\n\t\t\t----Library Management System----\n\t\t-------------------------------------------\n")
@@ -655,15 +3862,18 @@ def main():
             username = input("\n\t[] Enter username : ")
             password = input("\t[] Enter password : ")
 
-            cursor.execute("SELECT Role FROM Login WHERE Username = %s AND Password = %s", (username, password))
-            result = cursor.fetchone()
-
-            if result:
-                role = result[0]
-                if role == "admin":
-                    admin_menu()
-                elif role == "customer":
-                    customer_menu()
+            try:
+                session = login(username, password)
+            except LoginThrottledError as e:
+                print(e)
+                continue
+
+            if session:
+                if session.role == "admin":
+                    admin_menu(session)
+                elif session.role == "customer":
+                    customer_menu(session)
+                logout(session)
             else:
                 print("Invalid username or password.")
         elif choice == "3":
@@ -673,5 +3883,67 @@ def main():
             print("Invalid choice. Please select a valid option.")
 
 
+# Function to run the batch commands, used when the module is started with arguments
+def run_command(argv):
+    parser = argparse.ArgumentParser(description="Library Management System batch commands. "
+                                                 "Run without arguments for the interactive menus.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sweep = commands.add_parser("sweep-fines", help="charge fines for overdue loans")
+    sweep.add_argument("--as-of", type=datetime.date.fromisoformat, help="day to fine for, defaults to today")
+    sweep.add_argument("--workers", type=int, default=1, help="worker processes, each takes a UserID range")
+    sweep.add_argument("--chunk-size", type=int, default=FINE_SWEEP_CHUNK_SIZE, help="loans per transaction")
+
+    books = commands.add_parser("import-books", help="bulk import books from a CSV or JSON Lines file")
+    books.add_argument("path")
+    books.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="books per transaction")
+
+    users = commands.add_parser("import-users", help="bulk import logins from a CSV or JSON Lines file")
+    users.add_argument("path")
+    users.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="users per transaction")
+    users.add_argument("--rejects", help="CSV file listing rejected rows, defaults to <path>.rejects.csv")
+    users.add_argument("--hash-iterations", type=int,
+                       help="PBKDF2 rounds for imported passwords, upgraded to the full cost at the first login")
+
+    export = commands.add_parser("export-users", help="export logins to a CSV or JSON Lines file")
+    export.add_argument("path")
+    export.add_argument("--include-passwords", action="store_true", help="also export the password hashes")
+    export.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE, help="rows fetched per round trip")
+
+    recommend = commands.add_parser("build-recommendations",
+                                    help="rebuild the readers also rented table from the rental history")
+    recommend.add_argument("--top", type=int, default=RECOMMENDATIONS_PER_BOOK, help="recommendations per book")
+
+    listing = commands.add_parser("export", help="export a whole listing to a CSV, Parquet or Arrow file")
+    listing.add_argument("listing", choices=list(EXPORTS))
+    listing.add_argument("path", help="output file, the format follows the extension (.csv, .parquet, .arrow)")
+    listing.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="rows fetched and written per batch")
+
+    commands.add_parser("rebuild-listing", help="rebuild the book listing from the Book, Author, Genre and "
+                                               "Checkout tables")
+
+    args = parser.parse_args(argv)
+    configure_query_log()
+    migrate_schema()
+
+    if args.command == "sweep-fines":
+        run_fine_sweep(args.as_of, args.workers, args.chunk_size)
+    elif args.command == "import-books":
+        import_books(args.path, args.chunk_size)
+    elif args.command == "import-users":
+        import_users(args.path, args.chunk_size, args.rejects, args.hash_iterations)
+    elif args.command == "export-users":
+        export_users(args.path, args.include_passwords, args.chunk_size)
+    elif args.command == "export":
+        export_listing(args.listing, args.path, args.batch_size)
+    elif args.command == "build-recommendations":
+        build_recommendations(args.top)
+    elif args.command == "rebuild-listing":
+        print(f"---->Book listing rebuilt with {rebuild_book_listing()} books<----")
+
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        run_command(sys.argv[1:])
+    else:
+        main()
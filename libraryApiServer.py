@@ -0,0 +1,511 @@
+import asyncio
+import contextvars
+import datetime
+import json
+import os
+import re
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
+
+import libaryManagementSystem as library
+
+# Address the API listens on, each one can be overridden through the environment
+API_HOST = os.environ.get("LIBRARY_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("LIBRARY_API_PORT", "8080"))
+
+# Database calls are blocking, so they run on this many worker threads while the event loop keeps serving requests
+# It defaults to the connection pool size so a worker never waits for a pooled connection
+API_WORKERS = int(os.environ.get("LIBRARY_API_WORKERS", str(library.POOL_SIZE)))
+
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 1024 * 1024
+
+# Largest page size or row limit a client can ask for
+MAX_PAGE_SIZE = 100
+
+# Largest number of items priced by one POST /quotes request
+MAX_QUOTE_ITEMS = 1000
+
+# Seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 15
+
+HTTP_STATUS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    429: "Too Many Requests",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+executor = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="library-api")
+
+
+# Error raised by handlers to send a specific HTTP status back to the client
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# Class holding the parts of a parsed request that the handlers need
+class Request:
+    def __init__(self, method, path, query, headers, body, version="HTTP/1.1"):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.params = {}
+
+    # Return a query string parameter, or default when it is missing
+    def arg(self, name, default=None, convert=str):
+        values = self.query.get(name)
+        if not values or values[0] == "":
+            return default
+        try:
+            return convert(values[0])
+        except (ValueError, ArithmeticError):
+            raise ApiError(400, f"Invalid value for '{name}'.")
+
+    # Return a page size or row limit from the query string, kept within 1..maximum
+    def limit(self, name, default, maximum=MAX_PAGE_SIZE):
+        return min(max(self.arg(name, default, int), 1), maximum)
+
+    # Return the JSON body, checking that the required fields are present
+    def json(self, *required):
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            raise ApiError(400, "Request body must be valid JSON.")
+        if not isinstance(data, dict):
+            raise ApiError(400, "Request body must be a JSON object.")
+        missing = [field for field in required if data.get(field) in (None, "")]
+        if missing:
+            raise ApiError(400, "Missing field(s): " + ", ".join(missing))
+        return data
+
+
+# Function to return a field of a JSON body converted like Request.arg converts query parameters
+def body_field(data, name, convert=int):
+    try:
+        return convert(data[name])
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        raise ApiError(400, f"Invalid value for '{name}'.")
+
+
+# Function to return the optional discount code of a JSON body
+def discount_code(data):
+    code = data.get("discount_code")
+    if code is not None and not isinstance(code, str):
+        raise ApiError(400, "Invalid value for 'discount_code'.")
+    return code
+
+
+# Function to turn Decimal and date values into JSON friendly values
+def json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# Function to return the session token from an "Authorization: Bearer <token>" header
+def bearer_token(request):
+    header = request.headers.get("authorization", "")
+    if not header.lower().startswith("bearer "):
+        raise ApiError(401, "Authentication required.")
+    return header[7:].strip()
+
+
+# Function to look the caller's session up in the session cache, returns (username, role)
+# Tokens come from POST /login, so authenticated requests never hash a password or query the Login table
+def require_user(request, role=None):
+    token = bearer_token(request)
+    try:
+        session = library.require_session(token)
+    except library.NotAuthorizedError:
+        raise ApiError(401, "Invalid or expired session token.")
+    if role and session.role != role:
+        raise ApiError(403, f"This action requires the {role} role.")
+    library.current_actor.set(session.username)
+    return session.username, session.role
+
+
+def book_row(row):
+    return {"book_id": row[0], "title": row[1], "author": row[2], "genre": row[3], "rent_price": row[4]}
+
+
+# Handlers, each one takes a Request and returns (status, payload) and runs on a worker thread
+
+def handle_register(request):
+    data = request.json("username", "password", "first_name", "last_name", "email")
+    try:
+        library.register_user(data["username"], data["password"], data["first_name"], data["last_name"],
+                              data["email"])
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    except library.storage.integrity_error:
+        raise ApiError(409, "That username is already registered.")
+    return 201, {"username": data["username"], "role": "customer"}
+
+
+def handle_login(request):
+    data = request.json("username", "password")
+    try:
+        session = library.login(data["username"], data["password"])
+    except library.LoginThrottledError as e:
+        raise ApiError(429, str(e))
+    if session is None:
+        raise ApiError(401, "Invalid username or password.")
+    return 200, {"username": session.username, "role": session.role, "token": session.token,
+                 "expires_in": library.sessions.ttl}
+
+
+def handle_logout(request):
+    library.sessions.remove(bearer_token(request))
+    return 200, {"logged_out": True}
+
+
+def handle_list_books(request):
+    direction = request.arg("direction", "next")
+    if direction not in ("next", "prev", "jump"):
+        raise ApiError(400, "direction must be next, prev or jump.")
+    page = library.fetch_books_page(request.arg("after_id", 0, int),
+                                    request.limit("page_size", library.BOOKS_PAGE_SIZE), direction)
+    return 200, {"books": [book_row(row) for row in page]}
+
+
+def handle_search_books(request):
+    terms = request.arg("q")
+    if not terms:
+        raise ApiError(400, "Query parameter 'q' is required.")
+    results = library.search_books(terms, request.arg("genre"), request.arg("min_price", None, Decimal),
+                                   request.arg("max_price", None, Decimal), max(request.arg("page", 1, int), 1),
+                                   request.limit("page_size", library.BOOKS_PAGE_SIZE))
+    return 200, {"books": [dict(book_row(row), score=row[5]) for row in results]}
+
+
+def handle_popular_books(request):
+    books = library.fetch_popular_books(request.arg("genre"),
+                                        request.limit("limit", library.RECOMMENDATIONS_PER_BOOK))
+    return 200, {"books": [book_row(row) for row in books]}
+
+
+def handle_also_rented(request):
+    books = library.fetch_also_rented(int(request.params["book_id"]),
+                                      request.limit("limit", library.RECOMMENDATIONS_PER_BOOK))
+    return 200, {"books": [book_row(row) for row in books]}
+
+
+def handle_recommendations(request):
+    username, role = require_user(request)
+    books = library.fetch_recommendations(username, request.limit("limit", library.RECOMMENDATIONS_PER_BOOK))
+    return 200, {"books": [book_row(row) for row in books]}
+
+
+def handle_rent_book(request):
+    username, role = require_user(request)
+    data = request.json("book_id", "payment_method")
+    try:
+        payment_id, checkout_id, total_amount = library.process_rental(username, body_field(data, "book_id"),
+                                                                       data["payment_method"],
+                                                                       data.get("rating", ""),
+                                                                       discount_code=discount_code(data))
+    except library.BookUnavailableError as e:
+        raise ApiError(409, str(e))
+    except library.InvalidDiscountCodeError as e:
+        raise ApiError(400, str(e))
+    except ValueError as e:
+        raise ApiError(404, str(e))
+    return 201, {"payment_id": payment_id, "checkout_id": checkout_id, "amount": total_amount}
+
+
+def loan_row(row):
+    return {"checkout_id": row[0], "user_id": row[1], "book_id": row[2], "title": row[3], "rented_on": row[4],
+            "due_date": row[5]}
+
+
+def handle_list_loans(request):
+    username, role = require_user(request)
+    return 200, {"loans": [loan_row(row) for row in library.fetch_active_loans(username)]}
+
+
+def handle_return_book(request):
+    username, role = require_user(request)
+    checkout_id = body_field(request.json("checkout_id"), "checkout_id")
+    # Admins can close any loan, customers only their own
+    if not library.return_book(checkout_id, None if role == "admin" else username):
+        raise ApiError(404, "No open loan found with that CheckoutID.")
+    return 200, {"checkout_id": checkout_id}
+
+
+def handle_overdue_loans(request):
+    require_user(request, "admin")
+    loans = library.fetch_overdue_loans(request.arg("as_of", None, datetime.date.fromisoformat),
+                                        request.limit("limit", library.OVERDUE_PAGE_SIZE, library.OVERDUE_PAGE_SIZE),
+                                        request.arg("after_id", 0, int))
+    return 200, {"loans": [loan_row(row) for row in loans]}
+
+
+def handle_set_copies(request):
+    require_user(request, "admin")
+    copies = body_field(request.json("copies"), "copies")
+    if not library.set_book_copies(int(request.params["book_id"]), copies):
+        raise ApiError(409, "No such book, or more copies are on loan than the new total.")
+    return 200, {"book_id": int(request.params["book_id"]), "copies": copies}
+
+
+def handle_checkout_plan(request):
+    username, role = require_user(request)
+    data = request.json("plan_id", "payment_method")
+    try:
+        payment_id, checkout_id, total_amount = library.process_plan_checkout(
+            username, body_field(data, "plan_id"), data["payment_method"], discount_code=discount_code(data))
+    except library.InvalidDiscountCodeError as e:
+        raise ApiError(400, str(e))
+    except ValueError as e:
+        raise ApiError(404, str(e))
+    return 201, {"payment_id": payment_id, "checkout_id": checkout_id, "amount": total_amount}
+
+
+# Prices a whole cart, the body is {"items": [{"type": "book" | "plan", "id": ...}], "discount_code": ...}
+def handle_quote(request):
+    require_user(request)
+    data = request.json("items")
+    items = data["items"]
+    if not isinstance(items, list) or len(items) > MAX_QUOTE_ITEMS:
+        raise ApiError(400, f"'items' must be a list of at most {MAX_QUOTE_ITEMS} items.")
+    try:
+        cart = [(item["type"], int(item["id"])) for item in items]
+    except (KeyError, TypeError, ValueError):
+        raise ApiError(400, "Every item needs a 'type' and a numeric 'id'.")
+    try:
+        quotes = library.quote_many(cart, discount_code(data))
+    except library.InvalidDiscountCodeError as e:
+        raise ApiError(400, str(e))
+    except ValueError as e:
+        raise ApiError(404, str(e))
+    return 200, {"quotes": [quote.as_dict() for quote in quotes], "total": sum(quote.total for quote in quotes)}
+
+
+def handle_list_payments(request):
+    username, role = require_user(request)
+    # Customers only ever see their own payments
+    user_id = request.arg("user_id") if role == "admin" else username
+    limit = request.limit("limit", library.STREAM_CHUNK_SIZE, library.STREAM_CHUNK_SIZE)
+
+    chunks = library.stream_payments(request.arg("start_date", None, datetime.date.fromisoformat),
+                                     request.arg("end_date", None, datetime.date.fromisoformat),
+                                     user_id, limit, request.arg("after_id", 0, int))
+    # Only the first chunk is needed, closing the stream hands the connection back to the pool
+    rows = next(chunks, [])
+    chunks.close()
+    payments = [{"payment_id": row[0], "user_id": row[1], "amount": row[2], "payment_date": row[3],
+                 "payment_method": row[4]} for row in rows]
+    return 200, {"payments": payments}
+
+
+def handle_add_book(request):
+    require_user(request, "admin")
+    data = request.json("title", "author", "genre", "rent_price")
+    copies = body_field(data, "copies") if "copies" in data else 1
+    try:
+        book_id = library.create_book(data["title"], str(data["author"]), str(data["genre"]),
+                                      Decimal(str(data["rent_price"])), copies)
+    except ArithmeticError:
+        raise ApiError(400, "rent_price must be a number.")
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    return 201, {"book_id": book_id}
+
+
+def handle_update_book(request):
+    require_user(request, "admin")
+    data = request.json("title", "rent_price")
+    try:
+        updated = library.edit_book(int(request.params["book_id"]), data["title"], Decimal(str(data["rent_price"])))
+    except ArithmeticError:
+        raise ApiError(400, "rent_price must be a number.")
+    if not updated:
+        raise ApiError(404, "No book found with that BookID.")
+    return 200, {"book_id": int(request.params["book_id"])}
+
+
+def handle_delete_book(request):
+    require_user(request, "admin")
+    try:
+        removed = library.remove_book(int(request.params["book_id"]))
+    except library.storage.integrity_error:
+        raise ApiError(409, "The book has been rented and cannot be deleted.")
+    if not removed:
+        raise ApiError(404, "No book found with that BookID.")
+    return 200, {"book_id": int(request.params["book_id"])}
+
+
+def handle_metrics(request):
+    require_user(request, "admin")
+    # A string payload is sent as plain text, the format Prometheus scrapes
+    return 200, library.query_stats_prometheus()
+
+
+# Routes, each entry is (method, path pattern, handler)
+ROUTES = [
+    ("POST", r"/register", handle_register),
+    ("POST", r"/login", handle_login),
+    ("POST", r"/logout", handle_logout),
+    ("GET", r"/books", handle_list_books),
+    ("GET", r"/books/search", handle_search_books),
+    ("GET", r"/books/popular", handle_popular_books),
+    ("GET", r"/books/(?P<book_id>\d+)/also-rented", handle_also_rented),
+    ("GET", r"/recommendations", handle_recommendations),
+    ("POST", r"/books", handle_add_book),
+    ("PUT", r"/books/(?P<book_id>\d+)", handle_update_book),
+    ("DELETE", r"/books/(?P<book_id>\d+)", handle_delete_book),
+    ("PUT", r"/books/(?P<book_id>\d+)/copies", handle_set_copies),
+    ("POST", r"/rentals", handle_rent_book),
+    ("GET", r"/loans", handle_list_loans),
+    ("GET", r"/loans/overdue", handle_overdue_loans),
+    ("POST", r"/returns", handle_return_book),
+    ("POST", r"/plans/checkout", handle_checkout_plan),
+    ("POST", r"/quotes", handle_quote),
+    ("GET", r"/payments", handle_list_payments),
+    ("GET", r"/metrics", handle_metrics),
+]
+COMPILED_ROUTES = [(method, re.compile(pattern + r"/?"), handler) for method, pattern, handler in ROUTES]
+
+
+# Function to find the handler for a request, fills in the path parameters
+def route(request):
+    path_found = False
+    for method, pattern, handler in COMPILED_ROUTES:
+        match = pattern.fullmatch(request.path)
+        if match:
+            path_found = True
+            if method == request.method:
+                request.params = match.groupdict()
+                return handler
+    if path_found:
+        raise ApiError(405, "Method not allowed.")
+    raise ApiError(404, "Not found.")
+
+
+# Function to run the handler for a request on the worker pool, returns (status, payload)
+async def dispatch(request):
+    try:
+        handler = route(request)
+        loop = asyncio.get_running_loop()
+        # Each request runs in its own copy of the context, so the caller set by require_user() does not
+        # carry over to the next request served by the same worker thread
+        return await loop.run_in_executor(executor, contextvars.copy_context().run, handler, request)
+    except ApiError as e:
+        return e.status, {"error": e.message}
+    # Any other write breaking a constraint is a request that conflicts with the stored data
+    except library.storage.integrity_error:
+        return 409, {"error": "The request conflicts with existing data."}
+    except Exception:
+        traceback.print_exc()
+        return 500, {"error": "Internal server error."}
+
+
+# Function to read one HTTP request from the stream, returns None when the client closed the connection
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise ApiError(400, "Malformed request line.")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        raise ApiError(400, "Invalid Content-Length header.")
+    if length < 0:
+        raise ApiError(400, "Invalid Content-Length header.")
+    if length > MAX_BODY_SIZE:
+        raise ApiError(413, "Request body too large.")
+    body = await reader.readexactly(length) if length else b""
+
+    url = urlsplit(target)
+    return Request(method.upper(), url.path, parse_qs(url.query), headers, body, version)
+
+
+# Function to write a JSON response, or a plain text one when the payload is a string
+async def write_response(writer, status, payload, keep_alive):
+    if isinstance(payload, str):
+        body = payload.encode("utf-8")
+        content_type = "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body = json.dumps(payload, default=json_default).encode("utf-8")
+        content_type = "application/json"
+    head = (f"HTTP/1.1 {status} {HTTP_STATUS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+
+# Function to serve one client connection, requests on a keep-alive connection are handled one after another
+async def handle_connection(reader, writer):
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(read_request(reader), KEEP_ALIVE_TIMEOUT)
+            except ApiError as e:
+                await write_response(writer, e.status, {"error": e.message}, False)
+                break
+            if request is None:
+                break
+
+            keep_alive = (request.headers.get("connection", "").lower() != "close"
+                          and request.version == "HTTP/1.1")
+            status, payload = await dispatch(request)
+            await write_response(writer, status, payload, keep_alive)
+            if not keep_alive:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+# Function to start the API server and serve until interrupted
+async def serve(host=API_HOST, port=API_PORT):
+    loop = asyncio.get_running_loop()
+    library.configure_query_log()
+    await loop.run_in_executor(executor, library.migrate_schema)
+
+    server = await asyncio.start_server(handle_connection, host, port)
+    print(f"Library API listening on http://{host}:{port} with {API_WORKERS} worker threads")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("Shutting down...")
+    finally:
+        executor.shutdown()
@@ -0,0 +1,270 @@
+import argparse
+import datetime
+import random
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from tabulate import tabulate
+
+import libaryManagementSystem as library
+
+# Password given to every synthetic customer, it passes validate_password()
+BENCH_PASSWORD = "Bench@1234"
+BENCH_USER_PREFIX = "benchuser"
+PAYMENT_METHODS = ["gpay", "phonepay", "credit", "debit"]
+WORDS = ["river", "shadow", "garden", "empire", "silent", "winter", "golden", "night", "city", "storm",
+         "ocean", "glass", "forest", "iron", "secret", "paper", "moon", "fire", "last", "hidden"]
+
+
+# Function to insert rows in batches with executemany, each batch in its own transaction
+def insert_batches(query, rows, batch_size):
+    inserted = 0
+    for batch in library.chunked(rows, batch_size):
+        with library.get_cursor(commit=True) as cursor:
+            cursor.executemany(query, batch)
+        inserted += len(batch)
+    return inserted
+
+
+# Function to return the lowest and highest ID of a table
+def id_range(table, id_column):
+    with library.get_cursor() as cursor:
+        cursor.execute(f"SELECT MIN({id_column}), MAX({id_column}) FROM {table}")
+        return cursor.fetchone()
+
+
+# Function to fill every table with synthetic data, rows are generated lazily so memory stays flat at any volume
+def seed(args):
+    rng = random.Random(args.seed)
+    today = datetime.date.today()
+    # Hashing is deliberately slow, the synthetic customers all share one hash of the same password
+    password_hash = library.hash_password(BENCH_PASSWORD)
+    steps = [
+        ("Author", "INSERT IGNORE INTO Author (Name) VALUES (%s)",
+         ((f"Author {n}",) for n in range(args.authors))),
+        ("Genre", "INSERT IGNORE INTO Genre (Name) VALUES (%s)",
+         ((f"Genre {n}",) for n in range(args.genres))),
+        ("Plan", "INSERT INTO Plan (Duration, Cost, Details) VALUES (%s, %s, %s)",
+         ((f"{n + 1} month(s)", Decimal(99 * (n + 1)), "Synthetic plan") for n in range(args.plans))),
+        ("Login", "INSERT IGNORE INTO Login (Username, Password, FirstName, LastName, Email, Role) "
+                  "VALUES (%s, %s, %s, %s, %s, %s)",
+         ((f"{BENCH_USER_PREFIX}{n}", password_hash, "Bench", "User", f"{BENCH_USER_PREFIX}{n}@example.com",
+           "customer") for n in range(args.customers))),
+    ]
+
+    started = time.perf_counter()
+    for table, query, rows in steps:
+        count = insert_batches(query, rows, args.batch_size)
+        print(f"Seeded {count} {table} rows")
+
+    first_author, last_author = id_range("Author", "AuthorID")
+    first_genre, last_genre = id_range("Genre", "GenreID")
+    books = ((" ".join(rng.choice(WORDS) for _ in range(3)).title(), rng.randint(first_author, last_author),
+              rng.randint(first_genre, last_genre), Decimal(rng.randint(50, 500)), args.copies, args.copies)
+             for _ in range(args.books))
+    print(f"Seeded {insert_batches(library.INSERT_BOOK_QUERY, books, args.batch_size)} Book rows")
+
+    first_book, last_book = id_range("Book", "BookID")
+    first_plan, last_plan = id_range("Plan", "PlanID")
+
+    def random_user():
+        return f"{BENCH_USER_PREFIX}{rng.randrange(args.customers)}"
+
+    def random_date():
+        return today - datetime.timedelta(days=rng.randrange(args.history_days))
+
+    payments = ((random_user(), Decimal(rng.randint(100, 600)), random_date(), rng.choice(PAYMENT_METHODS))
+                for _ in range(args.payments))
+    print(f"Seeded {insert_batches(library.INSERT_PAYMENT_QUERY, payments, args.batch_size)} Payment rows")
+
+    # Historical loans are seeded as returned so they do not hold any copies
+    def random_loan():
+        rented_on = random_date()
+        returned_on = min(today, rented_on + datetime.timedelta(days=rng.randint(1, library.LOAN_PERIOD_DAYS)))
+        return (random_user(), rng.randint(first_book, last_book), str(rng.randint(1, 5)), rented_on,
+                rented_on + datetime.timedelta(days=library.LOAN_PERIOD_DAYS), returned_on)
+
+    checkouts = (random_loan() for _ in range(args.checkouts))
+    count = insert_batches("INSERT INTO Checkout (UserID, BookID, Rating, ReviewDate, DueDate, ReturnDate) "
+                           "VALUES (%s, %s, %s, %s, %s, %s)", checkouts, args.batch_size)
+    print(f"Seeded {count} Checkout rows")
+
+    # Books and loans were inserted directly, so the listing and its rental counts are built in one pass
+    print(f"Listed {library.rebuild_book_listing()} books")
+    library.build_recommendations()
+
+    print(f"Seeding finished in {time.perf_counter() - started:.1f}s")
+    return first_book, last_book, first_plan, last_plan
+
+
+# Function to return the value at the given percentile of an already sorted list (nearest rank)
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(percent / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+# Function to call an operation repeatedly from a number of threads, returns (latencies in ms, errors, wall time)
+# A call that raises still counts as a timed call, errors maps each exception type to how often it was raised
+def run_operation(operation, iterations, concurrency):
+    latencies = []
+    errors = {}
+    lock = threading.Lock()
+    per_thread = max(1, iterations // concurrency)
+
+    def worker(worker_id):
+        rng = random.Random(worker_id)
+        local = []
+        local_errors = {}
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            try:
+                operation(rng)
+            except Exception as e:
+                # A deadlock or pool timeout fails this call only, the thread carries on with the next one
+                local_errors[type(e).__name__] = local_errors.get(type(e).__name__, 0) + 1
+            local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(local)
+            for name, count in local_errors.items():
+                errors[name] = errors.get(name, 0) + count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+# Function to build the code paths to time, each entry is (name, operation taking a Random)
+def build_operations(args, first_book, last_book, first_plan, last_plan):
+    def random_user(rng):
+        return f"{BENCH_USER_PREFIX}{rng.randrange(args.customers)}"
+
+    def view_books(rng):
+        library.fetch_books_page(rng.randint(first_book, last_book), library.BOOKS_PAGE_SIZE, "jump")
+
+    def search_books(rng):
+        library.search_books(rng.choice(WORDS))
+
+    def add_book(rng):
+        library.create_book(f"Benchmark {rng.choice(WORDS).title()}", f"Author {rng.randrange(args.authors)}",
+                            f"Genre {rng.randrange(args.genres)}", Decimal(rng.randint(50, 500)))
+
+    def rent_book(rng):
+        try:
+            library.process_rental(random_user(rng), rng.randint(first_book, last_book),
+                                   rng.choice(PAYMENT_METHODS), "5")
+        except ValueError:
+            # Every copy of the book is on loan, the rejected reservation is still a timed round of the code path
+            pass
+
+    def checkout_plan(rng):
+        library.process_plan_checkout(random_user(rng), rng.randint(first_plan, last_plan),
+                                      rng.choice(PAYMENT_METHODS))
+
+    def quote_cart(rng):
+        cart = [("book", rng.randint(first_book, last_book)) for _ in range(args.cart_size)]
+        try:
+            library.quote_many(cart + [("plan", rng.randint(first_plan, last_plan))])
+        except ValueError:
+            # A book deleted since seeding left a gap in the IDs, the lookups were still timed
+            pass
+
+    def view_payments(rng):
+        for _ in library.stream_payments(user_id=random_user(rng)):
+            pass
+
+    def recommendations(rng):
+        library.fetch_recommendations(random_user(rng))
+
+    def login(rng):
+        library.authenticate(random_user(rng), BENCH_PASSWORD)
+
+    operations = [
+        ("view_books", view_books),
+        ("search_books", search_books),
+        ("login", login),
+        ("view_payments", view_payments),
+        ("recommendations", recommendations),
+        ("quote_cart", quote_cart),
+    ]
+    if not args.read_only:
+        operations += [
+            ("add_book", add_book),
+            ("rent_book", rent_book),
+            ("checkout_plan", checkout_plan),
+        ]
+    return [(name, operation) for name, operation in operations if not args.only or name in args.only]
+
+
+# Function to time every code path and print latency percentiles and throughput
+def benchmark(args, first_book, last_book, first_plan, last_plan):
+    report = []
+    failures = []
+    for name, operation in build_operations(args, first_book, last_book, first_plan, last_plan):
+        latencies, errors, elapsed = run_operation(operation, args.iterations, args.concurrency)
+        latencies.sort()
+        report.append([name, len(latencies), sum(errors.values()), f"{statistics.fmean(latencies):.2f}",
+                       f"{percentile(latencies, 50):.2f}", f"{percentile(latencies, 95):.2f}",
+                       f"{percentile(latencies, 99):.2f}", f"{latencies[-1]:.2f}",
+                       f"{len(latencies) / elapsed:.1f}"])
+        failures += [[name, error, count] for error, count in sorted(errors.items())]
+        print(f"Finished {name}")
+
+    headers = ["Operation", "Calls", "Errors", "Mean ms", "p50 ms", "p95 ms", "p99 ms", "Max ms", "Ops/second"]
+    print(f"\nBenchmark results ({args.concurrency} thread(s)):")
+    print(tabulate(report, headers=headers, tablefmt="grid"))
+    if failures:
+        print("\nFailed calls:")
+        print(tabulate(failures, headers=["Operation", "Error", "Calls"], tablefmt="grid"))
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Seed the library database with synthetic data and time the main code paths. "
+                    "Point LIBRARY_DB_NAME at a dedicated benchmark database, seeding adds rows to every table.")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--authors", type=int, default=1000)
+    parser.add_argument("--genres", type=int, default=50)
+    parser.add_argument("--plans", type=int, default=5)
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--payments", type=int, default=50000)
+    parser.add_argument("--checkouts", type=int, default=50000)
+    parser.add_argument("--copies", type=int, default=100, help="copies of each seeded book")
+    parser.add_argument("--history-days", type=int, default=730, help="spread payments over this many days")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per executemany batch while seeding")
+    parser.add_argument("--seed", type=int, default=42, help="random seed, the same seed generates the same data")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse data from an earlier run")
+    parser.add_argument("--iterations", type=int, default=500, help="calls per operation")
+    parser.add_argument("--concurrency", type=int, default=1, help="threads calling each operation at once")
+    parser.add_argument("--cart-size", type=int, default=10, help="books in each cart priced by quote_cart")
+    parser.add_argument("--read-only", action="store_true", help="skip the operations that write data")
+    parser.add_argument("--only", nargs="*", help="only time these operations")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    library.migrate_schema()
+
+    if args.skip_seed:
+        first_book, last_book = id_range("Book", "BookID")
+        first_plan, last_plan = id_range("Plan", "PlanID")
+        if first_book is None or first_plan is None:
+            print("No data to benchmark, run without --skip-seed first.")
+            return
+    else:
+        first_book, last_book, first_plan, last_plan = seed(args)
+
+    benchmark(args, first_book, last_book, first_plan, last_plan)
+
+
+if __name__ == "__main__":
+    main()
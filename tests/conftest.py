@@ -0,0 +1,62 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The tests run on an embedded SQLite database in a temporary directory, the module reads these settings on import
+TEST_DIR = tempfile.mkdtemp(prefix="library-tests-")
+os.environ["LIBRARY_DB_BACKEND"] = "sqlite"
+os.environ["LIBRARY_SQLITE_PATH"] = os.path.join(TEST_DIR, "library.db")
+os.environ["LIBRARY_PRICING_RULES"] = os.path.join(TEST_DIR, "pricing_rules.json")
+os.environ["LIBRARY_AUDIT_LOG_FILE"] = os.path.join(TEST_DIR, "audit.log")
+os.environ["LIBRARY_SLOW_QUERY_LOG"] = os.path.join(TEST_DIR, "slow_queries.log")
+# Hashing at the production cost would make every registration take most of a second
+os.environ["LIBRARY_PASSWORD_HASH_ITERATIONS"] = "1000"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import libaryManagementSystem as library  # noqa: E402
+
+PASSWORD = "Secret@123"
+
+# The tests share one database, so every user and book gets a name no other test uses
+serial_numbers = itertools.count(1)
+
+
+def unique(prefix):
+    return f"{prefix}{next(serial_numbers)}"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    library.migrate_schema()
+    yield
+    library.audit_log.flush()
+
+
+@pytest.fixture
+def new_customer():
+    def create():
+        username = unique("customer")
+        library.register_user(username, PASSWORD, "Test", "User", f"{username}@example.com")
+        return username
+    return create
+
+
+@pytest.fixture
+def customer(new_customer):
+    return new_customer()
+
+
+# A Poetry book with two copies, renting it costs 100.00 plus the default tax and service fee
+@pytest.fixture
+def book():
+    return library.create_book(unique("Test Book "), "Test Author", "Poetry", "100.00", 2)
+
+
+def query_value(query, params=()):
+    with library.get_cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchone()[0]
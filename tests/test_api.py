@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+import libaryManagementSystem as library
+import libraryApiServer as api
+from conftest import PASSWORD, query_value, unique
+
+
+def call(method, path, body=None, token=None):
+    headers = {"authorization": f"Bearer {token}"} if token else {}
+    request = api.Request(method, path, {}, headers, json.dumps(body).encode() if body is not None else b"")
+    return asyncio.run(api.dispatch(request))
+
+
+def admin_token():
+    username = unique("admin")
+    library.register_user(username, PASSWORD, "Test", "Admin", f"{username}@example.com", role="admin")
+    return library.login(username, PASSWORD).token
+
+
+def test_registering_a_taken_username_is_a_conflict(customer):
+    status, payload = call("POST", "/register", {"username": customer, "password": PASSWORD, "first_name": "Test",
+                                                 "last_name": "User", "email": f"{customer}@example.com"})
+
+    assert (status, payload) == (409, {"error": "That username is already registered."})
+
+
+def test_deleting_a_rented_book_is_a_conflict(customer, book):
+    library.process_rental(customer, book, "gpay")
+
+    status, _ = call("DELETE", f"/books/{book}", token=admin_token())
+
+    assert status == 409
+    assert query_value("SELECT COUNT(*) FROM Book WHERE BookID = %s", (book,)) == 1
+
+
+def test_discount_code_that_is_not_a_string_is_a_bad_request(customer, book):
+    token = library.login(customer, PASSWORD).token
+    bad_code = {"discount_code": 5}
+
+    assert call("POST", "/quotes", {"items": [{"type": "book", "id": book}], **bad_code}, token)[0] == 400
+    assert call("POST", "/rentals", {"book_id": book, "payment_method": "gpay", **bad_code}, token)[0] == 400
+    assert call("POST", "/plans/checkout", {"plan_id": 1, "payment_method": "gpay", **bad_code}, token)[0] == 400
+    assert query_value("SELECT COUNT(*) FROM Payment WHERE UserID = %s", (customer,)) == 0
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import pytest
+
+import libaryManagementSystem as library
+from conftest import query_value
+
+
+def available_copies(book_id):
+    return query_value("SELECT AvailableCopies FROM Book WHERE BookID = %s", (book_id,))
+
+
+def test_rental_takes_a_copy_and_return_puts_it_back(customer, book):
+    payment_id, checkout_id, total_amount = library.process_rental(customer, book, "gpay")
+
+    assert total_amount == Decimal("108.50")
+    assert available_copies(book) == 1
+    assert query_value("SELECT Rentals FROM BookListing WHERE BookID = %s", (book,)) == 1
+
+    assert library.return_book(checkout_id, customer)
+    assert available_copies(book) == 2
+
+
+def test_loan_is_returned_only_once(customer, book):
+    checkout_id = library.process_rental(customer, book, "gpay")[1]
+
+    assert library.return_book(checkout_id, customer)
+    assert not library.return_book(checkout_id, customer)
+    assert available_copies(book) == 2
+
+
+def test_customer_cannot_return_another_customers_loan(new_customer, book):
+    owner, other = new_customer(), new_customer()
+    checkout_id = library.process_rental(owner, book, "gpay")[1]
+
+    assert not library.return_book(checkout_id, other)
+    assert available_copies(book) == 1
+
+
+def test_rental_without_a_free_copy_writes_nothing(customer, book):
+    library.process_rental(customer, book, "gpay")
+    library.process_rental(customer, book, "gpay")
+
+    with pytest.raises(library.BookUnavailableError):
+        library.process_rental(customer, book, "gpay")
+
+    assert available_copies(book) == 0
+    assert query_value("SELECT COUNT(*) FROM Payment WHERE UserID = %s", (customer,)) == 2
+    assert query_value("SELECT COUNT(*) FROM Checkout WHERE UserID = %s", (customer,)) == 2
+
+
+def test_concurrent_rentals_never_take_more_copies_than_exist(customer, book):
+    def rent(_):
+        try:
+            return library.process_rental(customer, book, "gpay")
+        except library.BookUnavailableError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(rent, range(8)))
+
+    assert len([result for result in results if result]) == 2
+    assert available_copies(book) == 0
+    assert query_value("SELECT COUNT(*) FROM Checkout WHERE BookID = %s", (book,)) == 2
+
+
+def test_rental_of_unknown_book_is_reported(customer):
+    with pytest.raises(ValueError, match="No book found"):
+        library.process_rental(customer, 99999999, "gpay")
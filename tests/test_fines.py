@@ -0,0 +1,58 @@
+import datetime
+
+import libaryManagementSystem as library
+from conftest import query_value
+
+DUE_DATE = datetime.date(2026, 1, 1)
+# Amount a loan returned 10 days late is fined in total with the default tax and service fee
+TEN_DAYS_FINE = 10 * library.FINE_PER_DAY + library.TAX + library.SERVICE_FEE
+
+
+def overdue_loan(customer, book):
+    rented_on = DUE_DATE - datetime.timedelta(days=library.LOAN_PERIOD_DAYS)
+    return library.process_rental(customer, book, "gpay", payment_date=rented_on)[1]
+
+
+# Sweeps only the given customer's loans, so the tests do not fine each other's loans
+def sweep(customer, days_late):
+    return library.sweep_fines_partition(DUE_DATE + datetime.timedelta(days=days_late), customer, customer + "\0")
+
+
+def fines(customer):
+    with library.get_cursor() as cursor:
+        cursor.execute("SELECT Amount FROM Payment WHERE UserID = %s AND PaymentMethod = %s ORDER BY PaymentID",
+                       (customer, library.FINE_PAYMENT_METHOD))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def test_total_fine_does_not_depend_on_the_sweep_schedule(new_customer, book):
+    nightly, once = new_customer(), new_customer()
+    overdue_loan(nightly, book)
+    overdue_loan(once, book)
+
+    for days_late in range(1, 11):
+        sweep(nightly, days_late)
+    sweep(once, 10)
+
+    assert len(fines(nightly)) == 10
+    assert sum(fines(nightly)) == TEN_DAYS_FINE
+    assert fines(once) == [TEN_DAYS_FINE]
+
+
+def test_sweep_fines_a_loan_once_per_day(customer, book):
+    overdue_loan(customer, book)
+
+    assert sweep(customer, 3) == 1
+    assert sweep(customer, 3) == 0
+    assert len(fines(customer)) == 1
+
+
+def test_returned_and_current_loans_are_not_fined(customer, book):
+    returned = overdue_loan(customer, book)
+    library.return_book(returned, customer)
+    library.process_rental(customer, book, "gpay", payment_date=DUE_DATE)
+
+    assert sweep(customer, 5) == 0
+    assert fines(customer) == []
+    assert query_value("SELECT COUNT(*) FROM Checkout WHERE UserID = %s AND FinedThrough IS NOT NULL",
+                       (customer,)) == 0
@@ -0,0 +1,35 @@
+import csv
+from decimal import Decimal
+
+import libaryManagementSystem as library
+from conftest import query_value, unique
+
+
+def write_books(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Title", "Author", "Genre", "RentPrice", "Copies"])
+        writer.writerows(rows)
+
+
+def author_of(title):
+    return query_value("SELECT Author.Name FROM Book JOIN Author ON Book.AuthorID = Author.AuthorID "
+                       "WHERE Book.Title = %s", (title,))
+
+
+def test_import_books_reuses_names_stored_in_another_form(tmp_path, book):
+    known, new, invalid = unique("Imported Book "), unique("Imported Book "), unique("Imported Book ")
+    new_author = unique("Imported Author ")
+    path = tmp_path / "books.csv"
+    # Test Author and Poetry already exist, the collation matches them whatever the case
+    write_books(path, [
+        (known, "TEST AUTHOR", "poetry", "12.50", 1),
+        (new, new_author, "Poetry", "9.99", 3),
+        (invalid, "Test Author", "Poetry", "not a price", 1),
+    ])
+
+    assert library.import_books(str(path), chunk_size=2) == (2, 1)
+    assert author_of(known) == "Test Author"
+    assert author_of(new) == new_author
+    assert query_value("SELECT COUNT(*) FROM Author WHERE Name = %s", ("Test Author",)) == 1
+    assert query_value("SELECT RentPrice FROM BookListing WHERE Title = %s", (known,)) == Decimal("12.50")
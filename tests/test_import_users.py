@@ -0,0 +1,54 @@
+import csv
+
+import libaryManagementSystem as library
+from conftest import PASSWORD, unique
+
+
+def write_users(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Username", "Password", "FirstName", "LastName", "Email"])
+        for username, password in rows:
+            writer.writerow([username, password, "Test", "User", f"{username}@example.com"])
+
+
+def read_rejects(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        return {row["Username"]: row["Errors"] for row in csv.DictReader(file)}
+
+
+def test_import_users_stores_valid_rows_and_lists_the_rejected_ones(tmp_path, customer):
+    plain, hashed, weak, zero_rounds, bad_salt, duplicate = (unique("imported") for _ in range(6))
+    users_path = tmp_path / "users.csv"
+    rejects_path = tmp_path / "rejects.csv"
+    write_users(users_path, [
+        (plain, PASSWORD),
+        (hashed, library.hash_password(PASSWORD, 1000)),
+        (weak, "short"),
+        (zero_rounds, "pbkdf2_sha256$0$AAAA$BBBB"),
+        (bad_salt, "pbkdf2_sha256$1000$!!notb64$zz"),
+        (duplicate, PASSWORD),
+        (duplicate, PASSWORD),
+        (customer, PASSWORD),
+    ])
+
+    imported, rejected = library.import_users(str(users_path), chunk_size=3, rejects_path=str(rejects_path),
+                                              hash_iterations=1000)
+
+    assert (imported, rejected) == (3, 5)
+    rejects = read_rejects(rejects_path)
+    assert set(rejects) == {weak, zero_rounds, bad_salt, duplicate, customer}
+    assert "Password hash is malformed." in rejects[zero_rounds]
+    assert "Password hash is malformed." in rejects[bad_salt]
+    assert "more than once" in rejects[duplicate]
+    assert "already registered" in rejects[customer]
+
+    assert library.authenticate(plain, PASSWORD) == "customer"
+    assert library.authenticate(hashed, PASSWORD) == "customer"
+    assert library.authenticate(duplicate, PASSWORD) == "customer"
+
+
+def test_malformed_stored_hash_does_not_raise_on_login():
+    assert library.verify_password(PASSWORD, "pbkdf2_sha256$0$AAAA$BBBB") == (False, True)
+    assert not library.is_password_hash("pbkdf2_sha256$1000$!!notb64$zz")
+    assert library.is_password_hash(library.hash_password(PASSWORD, 1000))
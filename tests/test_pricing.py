@@ -0,0 +1,126 @@
+import datetime
+import json
+import os
+from decimal import Decimal
+
+import pytest
+
+import libaryManagementSystem as library
+
+MONDAY = datetime.date(2026, 10, 12)
+SATURDAY = datetime.date(2026, 10, 17)
+
+RULES = {
+    "tax": "4.00",
+    "service_fee": "5.00",
+    "rules": [
+        {"name": "Poetry sale", "genre": "Poetry", "percent_off": "10"},
+        {"name": "Plan 1 fee waived", "plan_id": 1, "service_fee": "0"},
+        {"name": "Weekend books", "item": "book", "weekdays": [5, 6], "amount_off": "2"},
+        {"name": "October plans", "item": "plan", "start": "2026-10-01", "end": "2026-10-31", "amount_off": "10"},
+        {"name": "Fine tax", "item": "fine", "tax": "1.00", "service_fee": "0"},
+    ],
+    "discount_codes": {
+        "welcome10": {"percent_off": "10"},
+        "PLANONLY": {"item": "plan", "amount_off": "50"},
+        "EXPIRED": {"amount_off": "5", "end": "2020-01-01"},
+    },
+}
+
+
+@pytest.fixture
+def rules():
+    return library.PricingRuleSet(RULES)
+
+
+def test_default_charges_apply_without_rules():
+    quote = library.PricingRuleSet({}).quote("book", 1, "100.00", "Poetry", MONDAY)
+
+    assert (quote.price, quote.tax, quote.service_fee) == (Decimal("100.00"), library.TAX, library.SERVICE_FEE)
+    assert quote.total == Decimal("100.00") + library.TAX + library.SERVICE_FEE
+    assert quote.applied == []
+
+
+def test_genre_rule_matches_books_of_that_genre_only(rules):
+    assert rules.quote("book", 1, "100", "poetry", MONDAY).price == Decimal("90.00")
+    assert rules.quote("book", 1, "100", "Drama", MONDAY).price == Decimal("100.00")
+
+
+def test_plan_rule_matches_that_plan_only(rules):
+    assert rules.quote("plan", 1, "100", on=MONDAY).service_fee == Decimal("0.00")
+    assert rules.quote("plan", 2, "100", on=MONDAY).service_fee == Decimal("5.00")
+
+
+def test_time_based_rules_follow_weekdays_and_dates(rules):
+    assert rules.quote("book", 1, "100", on=SATURDAY).price == Decimal("98.00")
+    assert rules.quote("book", 1, "100", on=MONDAY).price == Decimal("100.00")
+    assert rules.quote("plan", 2, "100", on=datetime.date(2026, 10, 31)).price == Decimal("90.00")
+    assert rules.quote("plan", 2, "100", on=datetime.date(2026, 11, 1)).price == Decimal("100.00")
+
+
+def test_matching_rules_apply_in_file_order(rules):
+    quote = rules.quote("book", 1, "100", "Poetry", SATURDAY)
+
+    assert quote.applied == ["Poetry sale", "Weekend books"]
+    assert quote.price == Decimal("88.00")
+
+
+def test_discount_code_is_applied_after_the_rules(rules):
+    quote = rules.quote("book", 1, "100", "Poetry", SATURDAY, discount_code="Welcome10")
+
+    assert quote.applied == ["Poetry sale", "Weekend books", "welcome10"]
+    assert quote.price == Decimal("79.20")
+
+
+def test_discount_code_for_another_item_type_is_not_applied(rules):
+    assert rules.quote("book", 1, "100", on=MONDAY, discount_code="planonly").price == Decimal("100.00")
+    assert rules.quote("plan", 2, "100", on=MONDAY, discount_code="planonly").price == Decimal("40.00")
+
+
+def test_unknown_or_expired_discount_code_is_refused(rules):
+    with pytest.raises(library.InvalidDiscountCodeError):
+        rules.quote("book", 1, "100", on=MONDAY, discount_code="NOPE")
+    with pytest.raises(library.InvalidDiscountCodeError):
+        rules.quote("book", 1, "100", on=MONDAY, discount_code="EXPIRED")
+
+
+def test_price_never_drops_below_zero():
+    rules = library.PricingRuleSet({"rules": [{"item": "book", "amount_off": "500"}]})
+
+    assert rules.quote("book", 1, "100", on=MONDAY).price == Decimal("0.00")
+
+
+def test_fine_rules_set_the_fine_charges(rules):
+    quote = rules.quote("fine", None, 0, on=MONDAY)
+
+    assert (quote.tax, quote.service_fee) == (Decimal("1.00"), Decimal("0.00"))
+
+
+def test_invalid_rules_are_refused():
+    with pytest.raises(ValueError, match="unknown field"):
+        library.PricingRuleSet({"rules": [{"genre": "Poetry", "percent": "10"}]})
+    with pytest.raises(ValueError, match="more than one kind"):
+        library.PricingRuleSet({"rules": [{"item": "plan", "genre": "Poetry", "percent_off": "10"}]})
+    with pytest.raises(ValueError, match="does not change"):
+        library.PricingRuleSet({"rules": [{"genre": "Poetry"}]})
+
+
+def write_rules(path, spec, mtime_ns):
+    path.write_text(json.dumps(spec), encoding="utf-8")
+    # Timestamps can be coarser than the time between two writes, so each version gets its own
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_engine_reloads_a_changed_file_and_keeps_the_rules_after_a_bad_edit(tmp_path, capsys):
+    path = tmp_path / "pricing_rules.json"
+    write_rules(path, {"tax": "1.00"}, 1_000_000_000)
+    engine = library.PricingEngine(str(path), check_interval=0)
+    assert engine.quote("book", 1, "10", on=MONDAY).tax == Decimal("1.00")
+
+    write_rules(path, {"tax": "2.00"}, 2_000_000_000)
+    assert engine.quote("book", 1, "10", on=MONDAY).tax == Decimal("2.00")
+
+    path.write_text("{not json", encoding="utf-8")
+    os.utime(path, ns=(3_000_000_000, 3_000_000_000))
+    assert engine.quote("book", 1, "10", on=MONDAY).tax == Decimal("2.00")
+    assert "Invalid pricing rules" in capsys.readouterr().out
@@ -0,0 +1,35 @@
+import threading
+
+import libaryManagementSystem as library
+
+
+def test_readers_of_a_book_are_recommended_what_else_they_rented(new_customer, book):
+    other_book = library.create_book("Also Rented", "Test Author", "Poetry", "100.00", 2)
+    for reader in (new_customer(), new_customer()):
+        library.process_rental(reader, book, "gpay")
+        library.process_rental(reader, other_book, "gpay")
+
+    library.build_recommendations()
+
+    assert other_book in [row[0] for row in library.fetch_also_rented(book)]
+
+
+def test_rentals_are_not_blocked_while_books_are_scored(customer, book, monkeypatch):
+    writes = []
+
+    # Writes from another connection while the scores are computed, it fails if the rebuild holds the write lock
+    def rent_during(score_pairs):
+        def score(*args):
+            thread = threading.Thread(target=lambda: writes.append(library.process_rental(customer, book, "gpay")))
+            thread.start()
+            thread.join()
+            yield from score_pairs(*args)
+        return score
+
+    monkeypatch.setattr(library, "SQLITE_BUSY_TIMEOUT", 0.2)
+    monkeypatch.setattr(library, "score_pairs_sparse", rent_during(library.score_pairs_sparse))
+    monkeypatch.setattr(library, "score_pairs_python", rent_during(library.score_pairs_python))
+
+    library.build_recommendations()
+
+    assert len(writes) == 1
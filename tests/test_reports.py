@@ -0,0 +1,84 @@
+import datetime
+from decimal import Decimal
+
+import libaryManagementSystem as library
+from conftest import query_value
+
+
+def daily(on, use_summary):
+    return library.run_report("daily", on, on, use_summary=use_summary)[2]
+
+
+def next_payment_id():
+    return query_value("SELECT MAX(PaymentID) FROM Payment") + 1
+
+
+def insert_payment(payment_id, customer, amount, on):
+    with library.get_cursor(commit=True) as cursor:
+        cursor.execute("INSERT INTO Payment (PaymentID, UserID, Amount, PaymentDate, PaymentMethod) "
+                       "VALUES (%s, %s, %s, %s, %s)", (payment_id, customer, amount, on, "gpay"))
+
+
+def test_summary_report_matches_the_live_report(customer, book):
+    on = datetime.date(2031, 1, 6)
+    library.process_rental(customer, book, "gpay", payment_date=on)
+    library.process_rental(customer, book, "card", payment_date=on)
+
+    assert daily(on, use_summary=True) == daily(on, use_summary=False)
+    assert daily(on, use_summary=True)[0][2] == 2
+    assert (library.run_report("method", on, on)[2] ==
+            library.run_report("method", on, on, use_summary=False)[2])
+    assert (library.run_report("books", on, on)[2] ==
+            library.run_report("books", on, on, use_summary=False)[2])
+
+
+def test_rows_past_a_gap_wait_for_the_late_commit(customer):
+    on = datetime.date(2031, 2, 3)
+    late_id = next_payment_id()
+    # The row after the gap commits first, as if the transaction that took late_id were still open
+    insert_payment(late_id + 1, customer, "10.00", on)
+
+    assert daily(on, use_summary=True) == []
+
+    insert_payment(late_id, customer, "20.00", on)
+
+    assert daily(on, use_summary=True) == daily(on, use_summary=False)
+    assert daily(on, use_summary=True)[0][2] == 2
+
+
+def test_gap_is_stepped_over_once_settled(customer, monkeypatch):
+    on = datetime.date(2031, 3, 3)
+    rolled_back_id = next_payment_id()
+    insert_payment(rolled_back_id + 1, customer, "10.00", on)
+
+    assert daily(on, use_summary=True) == []
+
+    monkeypatch.setattr(library, "REPORT_SETTLE_SECONDS", 0)
+
+    assert daily(on, use_summary=True) == daily(on, use_summary=False)
+    assert daily(on, use_summary=True)[0][2] == 1
+
+
+def test_revenue_is_added_up_exactly(customer):
+    on = datetime.date(2031, 4, 7)
+    for _ in range(3):
+        insert_payment(next_payment_id(), customer, "8.60", on)
+
+    for use_summary in (True, False):
+        (date, revenue, payments), = daily(on, use_summary)
+        assert (date, str(revenue), payments) == (on, "25.80", 3)
+        assert isinstance(revenue, Decimal)
+    assert query_value("SELECT typeof(Amount) FROM Payment WHERE PaymentDate = %s", (on,)) == "text"
+    assert query_value("SELECT Amount FROM Payment WHERE PaymentDate = %s", (on,)) == Decimal("8.60")
+
+
+def test_revenue_by_method_is_ordered_by_amount(customer):
+    on = datetime.date(2031, 5, 5)
+    insert_payment(next_payment_id(), customer, "9.00", on)
+    with library.get_cursor(commit=True) as cursor:
+        cursor.execute("INSERT INTO Payment (UserID, Amount, PaymentDate, PaymentMethod) VALUES (%s, %s, %s, %s)",
+                       (customer, "10.00", on, "card"))
+
+    for use_summary in (True, False):
+        rows = library.run_report("method", on, on, use_summary=use_summary)[2]
+        assert [(method, str(revenue)) for method, revenue, _ in rows] == [("card", "10.00"), ("gpay", "9.00")]
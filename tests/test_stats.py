@@ -0,0 +1,18 @@
+import time
+
+import libaryManagementSystem as library
+
+
+def test_time_at_a_prompt_is_not_counted_as_database_work(monkeypatch, capsys):
+    answers = iter(["customer", ""])
+
+    def slow_input(prompt):
+        time.sleep(0.3)
+        return next(answers)
+
+    monkeypatch.setattr("builtins.input", slow_input)
+    library.view_customer_details()
+
+    assert "Customer Details" in capsys.readouterr().out
+    assert "view_customer_details" not in library.operation_stats
+    assert library.operation_stats["list_customers"].total_ms < 300